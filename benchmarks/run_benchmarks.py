@@ -0,0 +1,117 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+
+# Headless benchmark of the assignation and SH priority engines on synthetic networks.
+#
+# Usage (against a SCRATCH PostGIS database, schema 'asset' is dropped and recreated):
+#   python benchmarks/run_benchmarks.py --dsn "dbname=bench user=postgres" --sizes 10000,100000 --reset
+#
+# Requires psycopg2 only: the engines run without QGIS.
+
+import argparse
+import importlib
+import json
+import os
+import sys
+
+import psycopg2
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+import synthetic_network  # noqa: E402
+
+PLUGIN_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+
+def load_engines():
+    """ Import the QGIS-free engines of the plugin package """
+
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    package = os.path.basename(PLUGIN_DIR)
+    assignation = importlib.import_module(f'{package}.core.engines.assignation')
+    priority = importlib.import_module(f'{package}.core.engines.priority')
+    db = importlib.import_module(f'{package}.core.engines.db')
+    feedback = importlib.import_module(f'{package}.core.engines.feedback')
+    return assignation.GwAssignationEngine, priority.GwPriorityEngine, db.GwPsycopgAdapter, feedback.GwEngineFeedback
+
+
+def stage_rows(stages):
+
+    rows = []
+    for stats in stages:
+        rows_count = stats.rows_in if stats.rows_in is not None else stats.rows_out
+        throughput = rows_count / stats.wall_time if rows_count and stats.wall_time else None
+        rows.append({
+            "stage": stats.stage_name,
+            "wall_time": round(stats.wall_time, 4),
+            "cpu_time": round(stats.cpu_time, 4),
+            "rows_in": stats.rows_in,
+            "rows_out": stats.rows_out,
+            "rows_per_second": round(throughput) if throughput else None,
+        })
+    return rows
+
+
+def print_report(size, engine, ok, rows):
+
+    print(f"\n{engine} - {size} arcs - {'OK' if ok else 'FAILED'}")
+    print(f"{'stage':<40}{'wall (s)':>10}{'cpu (s)':>10}{'rows in':>10}{'rows out':>10}{'rows/s':>12}")
+    for row in rows:
+        print(f"{row['stage']:<40}{row['wall_time']:>10}{row['cpu_time']:>10}"
+              f"{str(row['rows_in'] or ''):>10}{str(row['rows_out'] or ''):>10}{str(row['rows_per_second'] or ''):>12}")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark assignation and priority engines on synthetic networks")
+    parser.add_argument("--dsn", required=True, help="libpq connection string of a scratch PostGIS database")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma separated number of arcs (e.g. 10000,100000,1000000)")
+    parser.add_argument("--buffer", type=int, default=50)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate schema 'asset' if it exists")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    GwAssignationEngine, GwPriorityEngine, GwPsycopgAdapter, GwEngineFeedback = load_engines()
+    db = GwPsycopgAdapter(conn)
+    log_function = print if args.verbose else None
+
+    results = []
+    for size in [int(x) for x in args.sizes.split(",")]:
+        synthetic_network.create_schema(conn, reset=args.reset or bool(results))
+        n_arcs, n_leaks = synthetic_network.generate(conn, size, years=max(args.years * 2, 10))
+
+        feedback = GwEngineFeedback("Leak Assignation", log_function)
+        engine = GwAssignationEngine(db, feedback, "linear", args.buffer, args.years, True, True)
+        ok = engine.run()
+        rows = stage_rows(feedback.stage_recorder.stages)
+        print_report(size, "Assignation", ok, rows)
+        results.append({"engine": "assignation", "arcs": n_arcs, "leaks": n_leaks, "ok": ok, "stages": rows})
+
+        feedback = GwEngineFeedback("Calculate Priority", log_function)
+        engine = GwPriorityEngine(
+            db, feedback, "SH", "GLOBAL", f"bench_{size}", "Synthetic benchmark", None, None, None, None,
+            None, None, None, synthetic_network.CONFIG_DIAMETER, synthetic_network.CONFIG_MATERIAL,
+            synthetic_network.CONFIG_ENGINE,
+        )
+        ok = engine.run()
+        rows = stage_rows(feedback.stage_recorder.stages)
+        print_report(size, "Priority (SH)", ok, rows)
+        results.append({"engine": "priority_sh", "arcs": n_arcs, "leaks": n_leaks, "ok": ok, "stages": rows})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import os
+
+# Generator of a synthetic 'asset' schema (pipes, leaks and configuration) used by the benchmarks.
+# Everything is generated server side with generate_series, so 1M arcs take seconds, not minutes.
+
+SRID = 5367
+ORIGIN_X = 450000
+ORIGIN_Y = 1100000
+ARC_LENGTH = 100
+
+DIAMETERS = [63, 90, 110, 160, 200, 250, 315, 400, 500]
+MATERIALS = ['PVC', 'PE', 'FD', 'FC', 'ACERO']
+
+CONFIG_DIAMETER = {
+    110: {'cost_constr': 100.0, 'cost_repmain': 600.0, 'compliance': 10},
+    200: {'cost_constr': 150.0, 'cost_repmain': 800.0, 'compliance': 8},
+    315: {'cost_constr': 220.0, 'cost_repmain': 1100.0, 'compliance': 6},
+    600: {'cost_constr': 400.0, 'cost_repmain': 1600.0, 'compliance': 4},
+}
+CONFIG_MATERIAL = {
+    'PVC': {'compliance': 10},
+    'PE': {'compliance': 10},
+    'FD': {'compliance': 7},
+    'FC': {'compliance': 0},
+    'ACERO': {'compliance': 5},
+}
+CONFIG_ENGINE = {
+    'drate': 0.05,
+    'bratemain0': 0.05,
+    'expected_year': 0.5,
+    'compliance': 0.3,
+    'strategic': 0.2,
+}
+
+# The schema is the one shipped with the plugin (tables, functions, triggers and partitions), with the indexes of
+# tablect.sql created after the load. Its foreign keys point to Giswater tables not created here
+DBMODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dbmodel")
+
+# Columns and keys the engines write that ddl.sql doesn't declare (they come from the Giswater asset schema).
+# Only alterations of the shipped tables, so the drift stays visible here
+ENGINE_COLUMNS_SQL = """
+    CREATE SEQUENCE cat_result_result_id_seq OWNED BY cat_result.result_id;
+    ALTER TABLE cat_result
+        ALTER COLUMN result_id SET DEFAULT nextval('cat_result_result_id_seq'),
+        ADD COLUMN result_name text UNIQUE,
+        ADD COLUMN result_type text,
+        ADD COLUMN features text[],
+        ADD COLUMN presszone_id text,
+        ADD COLUMN dnom integer,
+        ADD COLUMN material_id text;
+
+    ALTER TABLE config_diameter
+        ADD COLUMN result_id integer,
+        ALTER COLUMN compliance TYPE integer USING compliance::integer,
+        DROP CONSTRAINT config_diameter_pkey,
+        ADD CONSTRAINT config_diameter_pkey PRIMARY KEY (result_id, dnom);
+    ALTER TABLE config_material
+        ADD COLUMN result_id integer,
+        ALTER COLUMN compliance TYPE integer USING compliance::integer,
+        DROP CONSTRAINT config_material_pkey,
+        ADD CONSTRAINT config_material_pkey PRIMARY KEY (result_id, material);
+    ALTER TABLE config_engine
+        ADD COLUMN result_id integer,
+        DROP CONSTRAINT config_engine_pkey,
+        ADD CONSTRAINT config_engine_pkey PRIMARY KEY (result_id, parameter);
+"""
+
+
+def read_dbmodel(filename):
+
+    with open(os.path.join(DBMODEL_DIR, filename), encoding="utf-8") as f:
+        return f.read()
+
+
+def get_schema_sql():
+
+    return (
+        "CREATE EXTENSION IF NOT EXISTS postgis;\n"
+        "CREATE SCHEMA asset;\n"
+        + read_dbmodel("ddl.sql").replace("SCHEMA_NAME", "asset")
+        + "\nSET search_path = asset, public;\n"
+        + ENGINE_COLUMNS_SQL
+    )
+
+
+def get_index_sql():
+    """ CREATE INDEX statements of tablect.sql """
+
+    statements = []
+    for statement in read_dbmodel("tablect.sql").split(";"):
+        lines = [line for line in statement.splitlines() if not line.strip().startswith("--")]
+        statement = " ".join(" ".join(lines).split())
+        if statement.upper().startswith("CREATE INDEX"):
+            statements.append(statement.replace(" ON ", " ON asset.", 1) + ";")
+    return "\n".join(statements)
+
+
+def schema_exists(cursor):
+
+    cursor.execute("SELECT 1 FROM information_schema.schemata WHERE schema_name = 'asset'")
+    return cursor.fetchone() is not None
+
+
+def create_schema(conn, reset=False):
+    """ Create the synthetic 'asset' schema. Refuses to touch an existing one unless @reset """
+
+    with conn.cursor() as cursor:
+        if schema_exists(cursor):
+            if not reset:
+                raise RuntimeError("Schema 'asset' already exists. Use a scratch database or pass reset=True.")
+            cursor.execute("DROP SCHEMA asset CASCADE")
+        cursor.execute(get_schema_sql())
+    conn.commit()
+
+
+def generate(conn, n_arcs, leaks_per_km_year=0.2, years=10, seed=0.42):
+    """ Fill arc_asset, arc_input and leaks with a regular grid network of @n_arcs pipes
+        and Poisson-like leaks located close to random pipes in the last @years years """
+
+    width = max(1, int((n_arcs / 2) ** 0.5))
+    n_leaks = int(n_arcs * ARC_LENGTH / 1000 * leaks_per_km_year * years)
+    str_diameters = ",".join(str(x) for x in DIAMETERS)
+    str_materials = ",".join(f"'{x}'" for x in MATERIALS)
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT setseed({seed})")
+        cursor.execute("INSERT INTO asset.exploitation (expl_id, name) VALUES (1, 'expl 1'), (2, 'expl 2')")
+        cursor.execute("INSERT INTO asset.presszone (presszone_id, name) VALUES ('1', 'pz 1'), ('2', 'pz 2'), ('3', 'pz 3')")
+        cursor.execute(f"""
+            INSERT INTO asset.arc_asset (arc_id, dnom, matcat_id, expl_id, presszone_id, builtdate, the_geom)
+            SELECT i,
+                (ARRAY[{str_diameters}])[1 + floor(random() * {len(DIAMETERS)})::int],
+                (ARRAY[{str_materials}])[1 + floor(random() * {len(MATERIALS)})::int],
+                1 + (i % 2),
+                (1 + (i % 3))::text,
+                date '1960-01-01' + (random() * 20000)::int,
+                ST_SetSRID(CASE WHEN i % 2 = 0 THEN
+                    ST_MakeLine(
+                        ST_MakePoint({ORIGIN_X} + ((i / 2) % {width}) * {ARC_LENGTH}, {ORIGIN_Y} + ((i / 2) / {width}) * {ARC_LENGTH}),
+                        ST_MakePoint({ORIGIN_X} + ((i / 2) % {width} + 1) * {ARC_LENGTH}, {ORIGIN_Y} + ((i / 2) / {width}) * {ARC_LENGTH}))
+                ELSE
+                    ST_MakeLine(
+                        ST_MakePoint({ORIGIN_X} + ((i / 2) % {width}) * {ARC_LENGTH}, {ORIGIN_Y} + ((i / 2) / {width}) * {ARC_LENGTH}),
+                        ST_MakePoint({ORIGIN_X} + ((i / 2) % {width}) * {ARC_LENGTH}, {ORIGIN_Y} + ((i / 2) / {width} + 1) * {ARC_LENGTH}))
+                END, {SRID})
+            FROM generate_series(0, {n_arcs - 1}) AS i
+        """)
+        # The rows of arc_input and their length come from the trigger on arc_asset
+        cursor.execute("""
+            UPDATE asset.arc_input
+            SET plan = random() < 0.01, social = false, other = false, mandatory = random() < 0.001
+        """)
+        cursor.execute(f"""
+            INSERT INTO asset.leaks (ext_code, material, startdate, the_geom)
+            SELECT 'SYN-' || r.j, a.matcat_id,
+                current_date - (random() * {years * 365})::int,
+                ST_Translate(ST_LineInterpolatePoint(a.the_geom, random()), random() * 20 - 10, random() * 20 - 10)
+            FROM (SELECT j, floor(random() * {n_arcs})::int AS arc_id
+                  FROM generate_series(1, {n_leaks}) AS j) AS r
+            JOIN asset.arc_asset a USING (arc_id)
+        """)
+        # leaks_stats is filled by the triggers on leaks
+        cursor.execute(get_index_sql())
+        cursor.execute("ANALYZE asset.arc_asset")
+        cursor.execute("ANALYZE asset.arc_input")
+        cursor.execute("ANALYZE asset.leaks")
+    conn.commit()
+
+    return n_arcs, n_leaks
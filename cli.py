@@ -0,0 +1,208 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+
+# Command line entry point to run the engines as batch jobs, without QGIS. From the plugins folder:
+#   python -m gw_assetmanage_plugin.cli --dsn "service=asset" assignation --buffer 500 --years 5
+#   python -m gw_assetmanage_plugin.cli --dsn "service=asset" sweep --buffers 25,50,100 --years 3,5
+#   python -m gw_assetmanage_plugin.cli --dsn "service=asset" import-leaks --path leaks_2023.gpkg
+#   python -m gw_assetmanage_plugin.cli --dsn "service=asset" cluster --method hilbert
+#   python -m gw_assetmanage_plugin.cli --dsn "service=asset" priority --result-name nightly_2023_01_01
+
+import argparse
+import sys
+
+from .core.engines.assignation import GwAssignationEngine, GwAssignationSweepEngine, LENGTH_MODES, SPATIAL_MODES
+from .core.engines.db import GwPsycopgAdapter
+from .core.engines.feedback import GwEngineFeedback
+from .core.engines.leak_import import GwLeakImportEngine
+from .core.engines.priority import GwPriorityEngine
+from .core.engines.storage import GwStorageMaintenanceEngine, CLUSTER_METHODS
+from .core.utils.config_parser import get_config
+
+
+def _get_engine_method():
+    """ Get 'engine_method' from the plugin config file """
+
+    return get_config().get("general", "engine_method", fallback="SH")
+
+
+def _get_def_config(db, def_table, table, key):
+    """ Read default configuration table @def_table keeping only the columns of result table @table """
+
+    rows = db.get_rows(
+        f"""
+        select column_name from information_schema.columns
+        where table_schema = 'asset' and table_name = '{table}'
+        """
+    )
+    columns = {row[0] for row in rows} - {"result_id", key}
+    config = {}
+    for row in db.get_rows(f"select * from asset.{def_table}", as_dict=True):
+        config[row[key]] = {k: v for k, v in row.items() if k in columns}
+    return config
+
+
+def run_assignation(db, args):
+
+    feedback = GwEngineFeedback("Leak Assignation", trace_memory=args.trace_memory)
+    engine = GwAssignationEngine(
+        db,
+        feedback,
+        args.method,
+        args.buffer,
+        args.years,
+        args.use_material,
+        args.use_diameter,
+        args.spatial_mode,
+        length_mode=args.length_mode,
+    )
+    return engine.run(), feedback
+
+
+def run_sweep(db, args):
+
+    feedback = GwEngineFeedback("Leak Assignation Sweep", trace_memory=args.trace_memory)
+    engine = GwAssignationSweepEngine(
+        db,
+        feedback,
+        [int(x) for x in args.buffers.split(",")],
+        [int(x) for x in args.years.split(",")],
+        args.methods.split(","),
+        args.use_material,
+        args.use_diameter,
+        args.spatial_mode,
+        length_mode=args.length_mode,
+    )
+    return engine.run(), feedback
+
+
+def run_import_leaks(db, args):
+
+    feedback = GwEngineFeedback("Leak Import", trace_memory=args.trace_memory)
+    engine = GwLeakImportEngine(db, feedback, args.path, args.layer, args.srid, not args.no_update)
+    return engine.run(), feedback
+
+
+def run_cluster(db, args):
+
+    feedback = GwEngineFeedback("Storage maintenance", trace_memory=args.trace_memory)
+    engine = GwStorageMaintenanceEngine(db, feedback, args.method, args.buffer, args.years)
+    return engine.run(), feedback
+
+
+def run_priority(db, args):
+
+    config_diameter = {
+        int(k): v for k, v in _get_def_config(db, "config_diameter_def", "config_diameter", "dnom").items()
+    }
+    config_material = _get_def_config(db, "config_material_def", "config_material", "material")
+    config_engine = {
+        row[0]: float(row[1]) for row in db.get_rows("select parameter, value from asset.config_engine_def")
+    }
+    features = args.features.split(",") if args.features else None
+
+    feedback = GwEngineFeedback("Calculate Priority", trace_memory=args.trace_memory)
+    engine = GwPriorityEngine(
+        db,
+        feedback,
+        args.engine_method or _get_engine_method(),
+        args.result_type,
+        args.result_name,
+        args.description,
+        features,
+        args.expl_id,
+        args.presszone_id,
+        args.dnom,
+        args.material,
+        None,
+        None,
+        config_diameter,
+        config_material,
+        config_engine,
+    )
+    return engine.run(), feedback
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog="gw_assetmanage_plugin.cli", description="Run asset management engines")
+    parser.add_argument("--dsn", required=True, help="libpq connection string (e.g. 'service=asset')")
+    parser.add_argument("--save-stats", action="store_true", help="Append stage stats to asset.log_task_stats")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure peak memory of every stage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_assignation = subparsers.add_parser("assignation", help="Assign leaks to pipes and calculate rleak")
+    parser_assignation.add_argument("--method", choices=["linear", "exponential"], default="linear")
+    parser_assignation.add_argument("--buffer", type=int, required=True)
+    parser_assignation.add_argument("--years", type=int, required=True)
+    parser_assignation.add_argument("--use-material", action="store_true")
+    parser_assignation.add_argument("--use-diameter", action="store_true")
+    parser_assignation.add_argument("--spatial-mode", choices=SPATIAL_MODES, default="postgis")
+    parser_assignation.add_argument("--length-mode", choices=LENGTH_MODES, default="intersection")
+
+    parser_sweep = subparsers.add_parser(
+        "sweep", help="Compare the rleak of several buffers, periods and methods without saving them"
+    )
+    parser_sweep.add_argument("--buffers", required=True, help="Comma separated list of buffers (e.g. 25,50,100)")
+    parser_sweep.add_argument("--years", required=True, help="Comma separated list of years (e.g. 3,5)")
+    parser_sweep.add_argument("--methods", default="linear", help="Comma separated list of linear, exponential")
+    parser_sweep.add_argument("--use-material", action="store_true")
+    parser_sweep.add_argument("--use-diameter", action="store_true")
+    parser_sweep.add_argument("--spatial-mode", choices=SPATIAL_MODES, default="postgis")
+    parser_sweep.add_argument("--length-mode", choices=LENGTH_MODES, default="intersection")
+
+    parser_import = subparsers.add_parser("import-leaks", help="Load the leaks of a CSV or GeoPackage file")
+    parser_import.add_argument("--path", required=True)
+    parser_import.add_argument("--layer", help="Layer of the GeoPackage (default: the first one)")
+    parser_import.add_argument("--srid", type=int, help="SRID of the coordinates (default: 5367 for CSV files)")
+    parser_import.add_argument("--no-update", action="store_true", help="Don't update leaks already loaded")
+
+    parser_cluster = subparsers.add_parser(
+        "cluster", help="Store pipes and leaks in spatial order and time the leak-pipe search before and after"
+    )
+    parser_cluster.add_argument("--method", choices=CLUSTER_METHODS, default="gist")
+    parser_cluster.add_argument("--buffer", type=int, default=500, help="Buffer of the timed search")
+    parser_cluster.add_argument("--years", type=int, default=5, help="Years of the timed search")
+
+    parser_priority = subparsers.add_parser("priority", help="Calculate priorities and save them as a new result")
+    parser_priority.add_argument("--result-name", required=True)
+    parser_priority.add_argument("--description", default="")
+    parser_priority.add_argument("--result-type", choices=["GLOBAL", "SELECTION"], default="GLOBAL")
+    parser_priority.add_argument("--engine-method", choices=["SH", "WM"])
+    parser_priority.add_argument("--features", help="Comma separated list of arc_id")
+    parser_priority.add_argument("--expl-id", type=int)
+    parser_priority.add_argument("--presszone-id")
+    parser_priority.add_argument("--dnom", type=int)
+    parser_priority.add_argument("--material")
+
+    args = parser.parse_args(argv)
+
+    import psycopg2
+    conn = psycopg2.connect(args.dsn)
+    db = GwPsycopgAdapter(conn)
+    try:
+        if args.command == "assignation":
+            status, feedback = run_assignation(db, args)
+        elif args.command == "sweep":
+            status, feedback = run_sweep(db, args)
+        elif args.command == "import-leaks":
+            status, feedback = run_import_leaks(db, args)
+        elif args.command == "cluster":
+            status, feedback = run_cluster(db, args)
+        else:
+            status, feedback = run_priority(db, args)
+        if args.save_stats:
+            feedback.stage_recorder.save(db)
+    finally:
+        conn.close()
+
+    return 0 if status else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
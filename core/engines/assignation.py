@@ -0,0 +1,604 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+
+
+from .leak_stats import MAX_DATE_SQL, get_leak_dates
+from .spatial import GwLeakSnapshot, subtract_years
+
+# Where leaks are matched with the pipes around them
+SPATIAL_MODES = ("postgis", "local")
+# How the length of a pipe inside the buffer of a leak is measured: 'intersection' of the pipe with the
+# buffer polygon, or 'projection' of the leak along the pipe (no polygons, exact for straight pipes)
+LENGTH_MODES = ("intersection", "projection")
+
+
+# Projection of the leaks along the pipes, used by the 'projection' length mode: position of the leak along
+# the pipe (extended beyond its ends along the first and last segment) and squared distance to the pipe line
+PROJECTION_SQL = """
+    CROSS JOIN LATERAL (
+        SELECT ST_LENGTH(a.the_geom) AS arc_length,
+            ST_LineLocatePoint(a.the_geom, l.the_geom) AS fraction,
+            ST_StartPoint(a.the_geom) AS p0,
+            ST_PointN(a.the_geom, 2) AS p1,
+            ST_PointN(a.the_geom, -2) AS pn1,
+            ST_EndPoint(a.the_geom) AS pn
+    ) AS g
+    CROSS JOIN LATERAL (
+        SELECT coalesce(CASE
+            WHEN g.fraction <= 0 THEN least(0,
+                ((ST_X(l.the_geom) - ST_X(g.p0)) * (ST_X(g.p1) - ST_X(g.p0))
+                + (ST_Y(l.the_geom) - ST_Y(g.p0)) * (ST_Y(g.p1) - ST_Y(g.p0)))
+                / nullif(ST_DISTANCE(g.p0, g.p1), 0))
+            WHEN g.fraction >= 1 THEN greatest(0,
+                ((ST_X(l.the_geom) - ST_X(g.pn)) * (ST_X(g.pn) - ST_X(g.pn1))
+                + (ST_Y(l.the_geom) - ST_Y(g.pn)) * (ST_Y(g.pn) - ST_Y(g.pn1)))
+                / nullif(ST_DISTANCE(g.pn1, g.pn), 0))
+        END, 0) AS overshoot
+    ) AS o
+    CROSS JOIN LATERAL (
+        SELECT g.arc_length AS arc_length,
+            g.fraction * g.arc_length + o.overshoot AS position,
+            ST_DISTANCE(l.the_geom, a.the_geom)^2 - o.overshoot^2 AS offset2
+    ) AS p
+"""
+
+
+# Length of every pipe: stored in arc_input.length by a trigger on arc_asset, measured if missing
+ARC_LENGTHS_SQL = """
+    SELECT a.arc_id, coalesce(i.length, ST_LENGTH(a.the_geom))
+    FROM asset.arc_asset a
+    LEFT JOIN asset.arc_input i USING (arc_id)
+"""
+
+
+def get_length_sql(buffer, length_mode="intersection"):
+    """ SQL expression of the length of pipe 'a' inside the buffer of leak 'l'.
+        The 'projection' mode needs PROJECTION_SQL in the FROM clause """
+
+    if length_mode == "projection":
+        half_chord = f"sqrt(greatest({buffer}^2 - p.offset2, 0))"
+        return f"least(p.arc_length, p.position + {half_chord}) - greatest(0, p.position - {half_chord})"
+    return f"ST_LENGTH(ST_INTERSECTION(ST_BUFFER(l.the_geom, {buffer}), a.the_geom))"
+
+
+def assign_leaks(rows, buffer, method, use_material=False, use_diameter=False):
+    """ Share every leak among the pipes around it.
+        :param rows: candidate leak-pipe pairs (leak_id, leak_diameter, leak_material,
+            arc_id, arc_diameter, arc_material, distance, length inside the buffer)
+        :return: leaks per pipe {arc_id: leaks}, ids of the assigned leaks and the count of leaks assigned
+            by material and diameter, by material, by diameter and to any pipe
+    """
+    leaks = {}
+    leaks_by_arc = {}
+
+    for row in rows:
+        (
+            leak_id,
+            leak_diameter,
+            leak_material,
+            arc_id,
+            arc_diameter,
+            arc_material,
+            distance,
+            length,
+        ) = row
+
+        distance_index = (buffer - distance) / buffer
+        if method == "exponential":
+            distance_index = distance_index**2
+        index = distance_index * length
+
+        if leak_id not in leaks:
+            leaks[leak_id] = []
+
+        leaks[leak_id].append(
+            {
+                "arc_id": arc_id,
+                "index": index,
+                "same_diameter": (
+                    # Diameters within 4mm are the same
+                    leak_diameter is not None
+                    and arc_diameter is not None
+                    and leak_diameter - 4 <= arc_diameter <= leak_diameter + 4
+                ),
+                "same_material": (
+                    # FIXME: Handle unknown materials
+                    leak_material is not None
+                    and leak_material == arc_material
+                ),
+            }
+        )
+
+    by_material_diameter = 0
+    by_material = 0
+    by_diameter = 0
+    any_pipe = 0
+
+    for leak_id, arcs in leaks.items():
+        same_material_exists = any([a["same_material"] for a in arcs])
+        same_diameter_exists = any([a["same_diameter"] for a in arcs])
+
+        if (
+            use_material
+            and use_diameter
+            and same_material_exists
+            and same_diameter_exists
+        ):
+            is_arc_valid = lambda x: x["same_material"] and x["same_diameter"]
+            by_material_diameter += 1
+        elif use_material and same_material_exists:
+            is_arc_valid = lambda x: x["same_material"]
+            by_material += 1
+        elif use_diameter and same_diameter_exists:
+            is_arc_valid = lambda x: x["same_diameter"]
+            by_diameter += 1
+        else:
+            is_arc_valid = lambda x: True
+            any_pipe += 1
+
+        valid_arcs = list(
+            filter(
+                is_arc_valid,
+                arcs,
+            )
+        )
+        sum_indexes = sum([a["index"] for a in valid_arcs])
+        for arc in valid_arcs:
+            if arc["arc_id"] not in leaks_by_arc:
+                leaks_by_arc[arc["arc_id"]] = 0
+            leaks_by_arc[arc["arc_id"]] += arc["index"] / sum_indexes
+
+    counts = (by_material_diameter, by_material, by_diameter, any_pipe)
+    return leaks_by_arc, set(leaks), counts
+
+
+def calculate_rleaks(arc_lengths, leaks_by_arc, years):
+    """ Leaks per km per year [arc_id, rleak] of the pipes with leaks, from rows of (arc_id, length in meters) """
+
+    rleaks = []
+    for row in arc_lengths:
+        arc_id, length = row
+        if length and (arc_id in leaks_by_arc):
+            length = length / 1000
+            rleak = leaks_by_arc.get(arc_id, 0) / (length * years)
+            if rleak != 0:
+                rleaks.append([arc_id, rleak])
+    return rleaks
+
+
+class GwAssignationEngine:
+    """ Assign leaks to the pipes around them and calculate leaks per km per year (rleak).
+        Free of QGIS: database access goes through @db (see engines.db) and progress through @feedback.
+        @spatial_mode 'postgis' runs the spatial join in the database, 'local' downloads leaks and pipes
+        once (or uses @snapshot) and runs it with a Shapely STRtree. @length_mode is one of LENGTH_MODES """
+
+    def __init__(
+        self,
+        db,
+        feedback,
+        method,
+        buffer,
+        years,
+        use_material=False,
+        use_diameter=False,
+        spatial_mode="postgis",
+        snapshot=None,
+        length_mode="intersection",
+    ):
+        if spatial_mode not in SPATIAL_MODES:
+            raise ValueError(f"Unknown spatial mode: '{spatial_mode}'")
+        if length_mode not in LENGTH_MODES:
+            raise ValueError(f"Unknown length mode: '{length_mode}'")
+        self.db = db
+        self.feedback = feedback
+        self.method = method
+        self.buffer = buffer
+        self.years = years
+        self.use_material = use_material
+        self.use_diameter = use_diameter
+        self.spatial_mode = spatial_mode
+        self.snapshot = snapshot
+        self.length_mode = length_mode
+
+    def run(self):
+        try:
+            if self.spatial_mode == "local" and self.snapshot is None:
+                with self.feedback.stage("Downloading leaks and pipes") as stats:
+                    self.snapshot = GwLeakSnapshot.download(self.db)
+                    stats.rows_out = len(self.snapshot.leak_id) + len(self.snapshot.arc_id)
+
+            with self.feedback.stage("Checking leak dates"):
+                max_date, min_date, interval = self._get_leak_dates()
+            if self.years > interval / 365:
+                self.feedback.emit_report(
+                    "Task canceled: The number of years is greater than the interval disponible.",
+                    f"Oldest leak: {min_date}.",
+                    f"Newest leak: {max_date}.",
+                )
+                return False
+
+            self.feedback.emit_report("Getting leak data from DB (1/4)...")
+            self.feedback.set_progress(0)
+
+            with self.feedback.stage("Getting leak data") as stats:
+                all_leaks = self._get_leaks()
+                stats.rows_out = len(all_leaks)
+
+            if self.feedback.is_canceled():
+                self.feedback.emit_report("Task canceled.")
+                return False
+            self.feedback.emit_report("Getting pipe data from DB (2/4)...")
+            self.feedback.set_progress(25)
+
+            with self.feedback.stage("Getting pipe data", rows_in=len(all_leaks)) as stats:
+                rows = self._get_candidates()
+                stats.rows_out = len(rows)
+
+            if self.feedback.is_canceled():
+                self.feedback.emit_report("Task canceled.")
+                return False
+
+            self.feedback.emit_report("Calculating leaks per km per year (3/4)...")
+            self.feedback.set_progress(50)
+            with self.feedback.stage("Calculating leaks per km per year", rows_in=len(rows)) as stats:
+                leaks_by_arc, assigned_leaks, counts = assign_leaks(
+                    rows, self.buffer, self.method, self.use_material, self.use_diameter
+                )
+                orphan_leaks = set(all_leaks) - assigned_leaks
+                by_material_diameter, by_material, by_diameter, any_pipe = counts
+                stats.rows_out = len(leaks_by_arc)
+
+            if self.feedback.is_canceled():
+                self.feedback.emit_report("Task canceled.")
+                return False
+
+            with self.feedback.stage("Calculating rleak per pipe") as stats:
+                rows = self._get_arc_lengths()
+                total_pipes = len(rows)
+                rleaks = calculate_rleaks(rows, leaks_by_arc, self.years)
+                stats.rows_in = total_pipes
+                stats.rows_out = len(rleaks)
+
+            if self.feedback.is_canceled():
+                self.feedback.emit_report("Task canceled.")
+                return False
+
+            self.feedback.emit_report("Saving results to DB (4/4)...")
+            self.feedback.set_progress(75)
+            with self.feedback.stage("Saving results to DB", rows_in=len(rleaks)):
+                sql = (
+                    "UPDATE asset.arc_input SET rleak = NULL; "
+                    + "INSERT INTO asset.arc_input (arc_id, rleak) VALUES "
+                )
+                for arc_id, rleak in rleaks:
+                    sql += f"({arc_id}, {rleak}),"
+                sql = (
+                    sql[:-1]
+                    + " ON CONFLICT(arc_id) DO UPDATE SET rleak=excluded.rleak;"
+                )
+                self.db.execute_sql(sql)
+
+            with self.feedback.stage("Generating result stats"):
+                orphan_pipes = self.db.get_rows(
+                    """
+                    SELECT count(*) FROM asset.arc_input
+                        WHERE rleak IS NULL or rleak = 0
+                    """
+                )[0][0]
+
+                max_rleak, min_rleak = self.db.get_rows(
+                    """
+                    SELECT max(rleak), min(rleak) FROM asset.arc_input
+                        WHERE rleak IS NOT NULL AND rleak <> 0
+                    """
+                )[0]
+
+            self.feedback.set_progress(100)
+
+            final_report = [
+                "Task finished!",
+                f"Leaks within the indicated period: {len(all_leaks)}.",
+                f"Leaks without pipes intersecting its buffer: {len(orphan_leaks)}.",
+            ]
+
+            if by_material_diameter:
+                final_report.append(
+                    f"Leaks assigned by material and diameter: {by_material_diameter}."
+                )
+            if by_material:
+                final_report.append(f"Leaks assigned by material only:  {by_material}.")
+            if by_diameter:
+                final_report.append(f"Leaks assigned by diameter only: {by_diameter}.")
+            if any_pipe:
+                final_report.append(f"Leaks assigned to any nearby pipes: {any_pipe}.")
+
+            final_report += [
+                f"Total of pipes: {total_pipes}.",
+                f"Pipes with zero leaks per km per year: {orphan_pipes}.",
+                f"Max rleak: {max_rleak} leaks/km.year.",
+                f"Min non-zero rleak: {min_rleak} leaks/km.year.",
+            ]
+
+            self.feedback.emit_report(*final_report)
+            return True
+
+        except Exception as e:
+            self.feedback.emit_report(f"Error: {e}")
+            return False
+
+    def _get_leak_dates(self):
+        """ Newest and oldest leak dates and the days between them """
+
+        if self.snapshot is not None:
+            return self.snapshot.get_leak_dates()
+        return get_leak_dates(self.db)
+
+    def _get_leaks(self):
+        """ Ids of the leaks within the period """
+
+        if self.snapshot is not None:
+            return self.snapshot.get_leaks(self.years)
+        sql = f"""
+            SELECT id
+            FROM asset.leaks
+            WHERE startdate > ({MAX_DATE_SQL} - INTERVAL '{self.years} year')::date
+            """
+        return [x[0] for x in self.db.get_rows(sql)]
+
+    def _get_candidates(self):
+        """ Leak-pipe pairs within the buffer: (leak_id, leak_diameter, leak_material,
+            arc_id, arc_diameter, arc_material, distance, length inside the buffer) """
+
+        if self.snapshot is not None:
+            return self.snapshot.get_candidates(self.buffer, self.years, self.length_mode)
+        return self.db.get_rows(
+            f"""
+            SELECT l.id AS leak_id,
+                l.diameter AS leak_diameter,
+                l.material AS leak_material,
+                a.arc_id AS arc_id,
+                a.dnom AS arc_diameter,
+                a.matcat_id AS arc_material,
+                ST_DISTANCE(l.the_geom, a.the_geom) AS distance,
+                {get_length_sql(self.buffer, self.length_mode)} AS length
+            FROM asset.leaks AS l
+            JOIN asset.arc_asset AS a ON 
+                ST_DWITHIN(l.the_geom, a.the_geom, {self.buffer})
+            {PROJECTION_SQL if self.length_mode == "projection" else ""}
+            WHERE l.startdate > ({MAX_DATE_SQL} - INTERVAL '{self.years} year')::date
+            """
+        )
+
+    def _get_arc_lengths(self):
+
+        if self.snapshot is not None:
+            return self.snapshot.get_arc_lengths()
+        return self.db.get_rows(ARC_LENGTHS_SQL)
+
+
+def _percentile(sorted_values, fraction):
+
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class GwAssignationSweepEngine:
+    """ Sensitivity of rleak to the buffer, the number of years and the method of the assignation.
+        Leak-pipe pairs are searched once, with the largest buffer and the widest period, and every
+        combination is derived from them. Nothing is saved to the database: @results keeps the
+        rleak distribution of every combination """
+
+    def __init__(
+        self,
+        db,
+        feedback,
+        buffers,
+        years,
+        methods=("linear",),
+        use_material=False,
+        use_diameter=False,
+        spatial_mode="postgis",
+        snapshot=None,
+        length_mode="intersection",
+    ):
+        if spatial_mode not in SPATIAL_MODES:
+            raise ValueError(f"Unknown spatial mode: '{spatial_mode}'")
+        if length_mode not in LENGTH_MODES:
+            raise ValueError(f"Unknown length mode: '{length_mode}'")
+        self.db = db
+        self.feedback = feedback
+        self.buffers = sorted(set(buffers))
+        self.years = sorted(set(years))
+        self.methods = list(methods)
+        self.use_material = use_material
+        self.use_diameter = use_diameter
+        self.spatial_mode = spatial_mode
+        self.snapshot = snapshot
+        self.length_mode = length_mode
+        self.results = []
+
+    def run(self):
+        try:
+            if self.spatial_mode == "local" and self.snapshot is None:
+                with self.feedback.stage("Downloading leaks and pipes") as stats:
+                    self.snapshot = GwLeakSnapshot.download(self.db)
+                    stats.rows_out = len(self.snapshot.leak_id) + len(self.snapshot.arc_id)
+
+            with self.feedback.stage("Checking leak dates"):
+                max_date, min_date, interval = self._get_leak_dates()
+            invalid_years = [y for y in self.years if y > interval / 365]
+            if invalid_years:
+                self.feedback.emit_report(
+                    f"Years ignored, greater than the interval disponible: {invalid_years}.",
+                    f"Oldest leak: {min_date}.",
+                    f"Newest leak: {max_date}.",
+                )
+                self.years = [y for y in self.years if y not in invalid_years]
+            if not self.years or not self.buffers:
+                self.feedback.emit_report("Task canceled: No combinations to calculate.")
+                return False
+
+            self.feedback.emit_report(
+                f"Searching pipes around leaks once (buffer {self.buffers[-1]}, {self.years[-1]} years)..."
+            )
+            self.feedback.set_progress(0)
+            with self.feedback.stage("Getting leak data") as stats:
+                leaks = self._get_leaks(self.years[-1])
+                stats.rows_out = len(leaks)
+            with self.feedback.stage("Getting pipe data", rows_in=len(leaks)) as stats:
+                rows = self._get_candidates()
+                stats.rows_out = len(rows)
+            with self.feedback.stage("Getting pipe lengths") as stats:
+                arc_lengths = self._get_arc_lengths()
+                stats.rows_out = len(arc_lengths)
+            self.feedback.set_progress(50)
+
+            combinations = len(self.years) * len(self.buffers) * len(self.methods)
+            with self.feedback.stage("Calculating combinations", rows_in=combinations):
+                done = 0
+                for years in self.years:
+                    cutoff = subtract_years(max_date, years)
+                    period_leaks = [leak_id for leak_id, leak_date in leaks if leak_date > cutoff]
+                    for buffer_index, buffer in enumerate(self.buffers):
+                        if self.feedback.is_canceled():
+                            self.feedback.emit_report("Task canceled.")
+                            return False
+                        candidates = [
+                            row[:7] + (row[8][buffer_index],)
+                            for row in rows
+                            if row[7] > cutoff and row[6] <= buffer
+                        ]
+                        for method in self.methods:
+                            self.results.append(
+                                self._get_distribution(
+                                    years, buffer, method, period_leaks, candidates, arc_lengths
+                                )
+                            )
+                            done += 1
+                            self.feedback.set_progress(50 + 50 * done / combinations)
+
+            self.feedback.emit_report(*self.get_report())
+            return True
+
+        except Exception as e:
+            self.feedback.emit_report(f"Error: {e}")
+            return False
+
+    def _get_distribution(self, years, buffer, method, period_leaks, candidates, arc_lengths):
+
+        leaks_by_arc, assigned_leaks, counts = assign_leaks(
+            candidates, buffer, method, self.use_material, self.use_diameter
+        )
+        rleaks = sorted(rleak for arc_id, rleak in calculate_rleaks(arc_lengths, leaks_by_arc, years))
+        return {
+            "buffer": buffer,
+            "years": years,
+            "method": method,
+            "leaks": len(period_leaks),
+            "orphan_leaks": len(set(period_leaks) - assigned_leaks),
+            "pipes": len(rleaks),
+            "mean": sum(rleaks) / len(rleaks) if rleaks else None,
+            "median": _percentile(rleaks, 0.5),
+            "p90": _percentile(rleaks, 0.9),
+            "max": rleaks[-1] if rleaks else None,
+        }
+
+    def get_report(self):
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.3f}"
+
+        report = ["buffer | years | method | leaks | orphan leaks | pipes with rleak | mean | median | p90 | max"]
+        for r in self.results:
+            report.append(
+                f"{r['buffer']} | {r['years']} | {r['method']} | {r['leaks']} | {r['orphan_leaks']} | "
+                f"{r['pipes']} | {fmt(r['mean'])} | {fmt(r['median'])} | {fmt(r['p90'])} | {fmt(r['max'])}"
+            )
+        return report
+
+    def _get_leak_dates(self):
+
+        if self.snapshot is not None:
+            return self.snapshot.get_leak_dates()
+        return get_leak_dates(self.db)
+
+    def _get_leaks(self, years):
+        """ (id, date) of the leaks within the widest period """
+
+        if self.snapshot is not None:
+            mask = self.snapshot.get_period_mask(years)
+            return list(
+                zip(
+                    self.snapshot.leak_id[mask].tolist(),
+                    self.snapshot.leak_date[mask].tolist(),
+                )
+            )
+        return self.db.get_rows(
+            f"""
+            SELECT id, startdate
+            FROM asset.leaks
+            WHERE startdate > ({MAX_DATE_SQL} - INTERVAL '{years} year')::date
+            """
+        )
+
+    def _get_candidates(self):
+        """ Leak-pipe pairs within the largest buffer and the widest period: (leak_id, leak_diameter,
+            leak_material, arc_id, arc_diameter, arc_material, distance, leak_date, [length inside every buffer]) """
+
+        max_buffer = self.buffers[-1]
+        max_years = self.years[-1]
+
+        if self.snapshot is not None:
+            snapshot = self.snapshot
+            mask = snapshot.get_period_mask(max_years)
+            leak_index, arc_index, distance = snapshot.get_candidate_pairs(max_buffer, mask)
+            lengths = []
+            for buffer in self.buffers:
+                within = distance <= buffer
+                length = snapshot.np.zeros(len(distance))
+                length[within] = snapshot.get_lengths(
+                    buffer, leak_index[within], arc_index[within], distance[within], self.length_mode
+                )
+                lengths.append(length)
+            return snapshot.to_rows(
+                leak_index,
+                arc_index,
+                distance,
+                snapshot.leak_date[leak_index],
+                snapshot.np.column_stack(lengths).tolist(),
+            )
+
+        lengths = ",".join(get_length_sql(buffer, self.length_mode) for buffer in self.buffers)
+        return self.db.get_rows(
+            f"""
+            SELECT l.id,
+                l.diameter,
+                l.material,
+                a.arc_id,
+                a.dnom,
+                a.matcat_id,
+                ST_DISTANCE(l.the_geom, a.the_geom),
+                l.startdate,
+                ARRAY[{lengths}]
+            FROM asset.leaks AS l
+            JOIN asset.arc_asset AS a ON
+                ST_DWITHIN(l.the_geom, a.the_geom, {max_buffer})
+            {PROJECTION_SQL if self.length_mode == "projection" else ""}
+            WHERE l.startdate > ({MAX_DATE_SQL} - INTERVAL '{max_years} year')::date
+            """
+        )
+
+    def _get_arc_lengths(self):
+
+        if self.snapshot is not None:
+            return self.snapshot.get_arc_lengths()
+        return self.db.get_rows(ARC_LENGTHS_SQL)
@@ -0,0 +1,275 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import threading
+from math import sqrt
+
+# numpy (and scipy, if installed) are imported by the functions that compute a comparison, so the result
+# selector can read the cache and show comparisons without them
+
+# Sizes of the top of the priority lists compared
+TOP_N = (10, 100, 1000)
+# Fractions of the total cost of the main result where the cumulative length curves are compared
+BUDGET_FRACTIONS = (0.1, 0.25, 0.5, 0.75, 1.0)
+# Pipes with the largest rank shift listed in the comparison
+TOP_MOVERS = 10
+# Comparisons kept in memory
+CACHE_SIZE = 20
+
+_comparisons = {}
+_lock = threading.Lock()
+
+
+def rankdata(values):
+    """ Average ranks (1-based) of @values, ties get the mean of their ranks """
+
+    import numpy as np
+
+    sorter = np.argsort(values, kind="mergesort")
+    inverse = np.empty(len(values), dtype=np.intp)
+    inverse[sorter] = np.arange(len(values))
+    sorted_values = values[sorter]
+    obs = np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+    dense = obs.cumsum()[inverse]
+    count = np.r_[np.nonzero(obs)[0], len(obs)]
+    return 0.5 * (count[dense] + count[dense - 1] + 1)
+
+
+def _count_tied_pairs(sorted_values):
+
+    import numpy as np
+
+    obs = np.r_[True, sorted_values[1:] != sorted_values[:-1], True]
+    counts = np.diff(np.nonzero(obs)[0]).astype(np.float64)
+    return float((counts * (counts - 1) / 2).sum())
+
+
+def _count_inversions(values):
+    """ Number of pairs i < j with values[i] > values[j], with a Fenwick tree: O(n log n) """
+
+    import numpy as np
+
+    dense = np.unique(values, return_inverse=True)[1].ravel() + 1
+    size = int(dense.max()) if len(dense) else 0
+    tree = [0] * (size + 1)
+    inversions = 0
+    for seen, value in enumerate(dense.tolist()):
+        # Elements already seen that are lower or equal than value
+        i = value
+        lower_or_equal = 0
+        while i > 0:
+            lower_or_equal += tree[i]
+            i -= i & -i
+        inversions += seen - lower_or_equal
+        i = value
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return inversions
+
+
+def kendall_tau_b(x, y):
+    """ Kendall's tau-b of @x and @y in O(n log n) (Knight's algorithm) """
+
+    import numpy as np
+
+    n = len(x)
+    if n < 2:
+        return None
+    try:
+        from scipy import stats as scipy_stats
+        return float(scipy_stats.kendalltau(x, y)[0])
+    except ImportError:
+        pass
+
+    order = np.lexsort((y, x))
+    x = x[order]
+    y = y[order]
+    n0 = n * (n - 1) / 2
+    ties_x = _count_tied_pairs(x)
+    ties_xy = _count_tied_pairs(np.rec.fromarrays([x, y]))
+    ties_y = _count_tied_pairs(np.sort(y, kind="mergesort"))
+    discordant = _count_inversions(y)
+    denominator = sqrt((n0 - ties_x) * (n0 - ties_y))
+    if not denominator:
+        return None
+    return (n0 - ties_x - ties_y + ties_xy - 2 * discordant) / denominator
+
+
+def spearman_rho(x, y):
+
+    import numpy as np
+
+    if len(x) < 2:
+        return None
+    rank_x = rankdata(x)
+    rank_y = rankdata(y)
+    if rank_x.std() == 0 or rank_y.std() == 0:
+        return None
+    return float(np.corrcoef(rank_x, rank_y)[0, 1])
+
+
+def _load_result(rows, result_id):
+    """ Arrays of a result sorted by priority (orderby, then arc_id) """
+
+    import numpy as np
+
+    rows = [row for row in rows if row[0] == result_id]
+    arc_id = np.array([row[1] for row in rows], dtype=np.int64)
+    # Pipes without priority go last
+    orderby = np.array([row[2] if row[2] is not None else len(rows) + 1 for row in rows], dtype=np.float64)
+    cost = np.array([row[3] or 0 for row in rows], dtype=np.float64)
+    length = np.array([row[4] or 0 for row in rows], dtype=np.float64)
+    order = np.lexsort((arc_id, orderby))
+    return arc_id[order], orderby[order], cost[order], length[order]
+
+
+def compare_results(db, result_main, result_compare):
+    """ Compare the priorities of two results: rank shifts, Spearman and Kendall correlation,
+        top-N overlap and cumulative cost/length curves. Both results are read with a single query """
+
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError("The comparison of results requires numpy")
+
+    rows = db.get_rows(
+        f"""
+        select result_id, arc_id, orderby, budget, length
+        from asset.arc_output
+        where result_id in ({int(result_main)}, {int(result_compare)})
+        """
+    )
+    arc_main, rank_main, cost_main, length_main = _load_result(rows, result_main)
+    arc_compare, rank_compare, cost_compare, length_compare = _load_result(rows, result_compare)
+
+    # Rank shifts of the pipes in both results
+    common, index_main, index_compare = np.intersect1d(arc_main, arc_compare, return_indices=True)
+    ranks_main = rank_main[index_main]
+    ranks_compare = rank_compare[index_compare]
+    shift = ranks_compare - ranks_main
+    abs_shift = np.abs(shift)
+    # Only pipes that moved
+    moved = np.flatnonzero(abs_shift > 0)
+    movers = moved[np.argsort(-abs_shift[moved], kind="mergesort")][:TOP_MOVERS]
+
+    # Overlap of the top of both priority lists
+    # Results smaller than a size are compared at their own size
+    top_n_overlap = {}
+    size = min(len(arc_main), len(arc_compare))
+    for n in sorted({min(n, size) for n in TOP_N} - {0}):
+        top_n_overlap[n] = len(np.intersect1d(arc_main[:n], arc_compare[:n])) / n
+
+    # Length replaced by both results for the same budgets
+    cum_cost_main = np.cumsum(cost_main)
+    cum_cost_compare = np.cumsum(cost_compare)
+    cum_length_main = np.r_[0, np.cumsum(length_main)]
+    cum_length_compare = np.r_[0, np.cumsum(length_compare)]
+    total_cost = cum_cost_main[-1] if len(cum_cost_main) else 0
+    budgets = np.array(BUDGET_FRACTIONS) * total_cost
+    curves = []
+    for fraction, budget, length_a, length_b in zip(
+        BUDGET_FRACTIONS,
+        budgets,
+        cum_length_main[np.searchsorted(cum_cost_main, budgets, side="right")],
+        cum_length_compare[np.searchsorted(cum_cost_compare, budgets, side="right")],
+    ):
+        curves.append(
+            {
+                "budget_fraction": fraction,
+                "budget": float(budget),
+                "length_main": float(length_a),
+                "length_compare": float(length_b),
+            }
+        )
+
+    return {
+        "result_main": result_main,
+        "result_compare": result_compare,
+        "arcs_main": len(arc_main),
+        "arcs_compare": len(arc_compare),
+        "arcs_common": len(common),
+        "spearman": spearman_rho(ranks_main, ranks_compare),
+        "kendall": kendall_tau_b(ranks_main, ranks_compare),
+        "rank_shift": {
+            "mean": float(abs_shift.mean()) if len(common) else None,
+            "median": float(np.median(abs_shift)) if len(common) else None,
+            "max": float(abs_shift.max()) if len(common) else None,
+            "up": int((shift < 0).sum()),
+            "down": int((shift > 0).sum()),
+            "same": int((shift == 0).sum()),
+        },
+        "top_movers": [
+            (int(common[i]), int(ranks_main[i]), int(ranks_compare[i])) for i in movers
+        ],
+        "top_n_overlap": top_n_overlap,
+        "curves": curves,
+    }
+
+
+def get_comparison(db, result_main, result_compare, reload=False):
+    """ Return the comparison of two results, computed once per pair of results """
+
+    key = (int(result_main), int(result_compare))
+    with _lock:
+        if key in _comparisons and not reload:
+            return _comparisons[key]
+
+    comparison = compare_results(db, *key)
+    with _lock:
+        _comparisons[key] = comparison
+        while len(_comparisons) > CACHE_SIZE:
+            del _comparisons[next(iter(_comparisons))]
+    return comparison
+
+
+def get_cached_comparison(result_main, result_compare):
+
+    with _lock:
+        return _comparisons.get((int(result_main), int(result_compare)))
+
+
+def invalidate(result_ids=None):
+    """ Forget the comparisons of @result_ids (all of them if None) """
+
+    with _lock:
+        if result_ids is None:
+            _comparisons.clear()
+            return
+        result_ids = {int(x) for x in result_ids}
+        for key in [key for key in _comparisons if result_ids.intersection(key)]:
+            del _comparisons[key]
+
+
+def comparison_to_text(comparison):
+
+    def fmt(value, digits=3):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    shift = comparison["rank_shift"]
+    lines = [
+        f"Pipes: {comparison['arcs_main']} (main), {comparison['arcs_compare']} (compare), "
+        f"{comparison['arcs_common']} in both.",
+        f"Spearman correlation: {fmt(comparison['spearman'])}.",
+        f"Kendall correlation: {fmt(comparison['kendall'])}.",
+        f"Rank shift: mean {fmt(shift['mean'], 1)}, median {fmt(shift['median'], 1)}, max {fmt(shift['max'], 0)}. "
+        f"Up: {shift['up']}, down: {shift['down']}, same: {shift['same']}.",
+        "",
+        "Top-N overlap:",
+    ]
+    for n, overlap in comparison["top_n_overlap"].items():
+        lines.append(f"  Top {n}: {overlap:.0%}")
+    lines += ["", "Length replaced for the same budget (main / compare):"]
+    for curve in comparison["curves"]:
+        lines.append(
+            f"  {curve['budget_fraction']:.0%} ({curve['budget']:,.0f}): "
+            f"{curve['length_main']:,.0f} m / {curve['length_compare']:,.0f} m"
+        )
+    lines += ["", "Largest rank shifts (arc_id: main -> compare):"]
+    for arc_id, rank_main, rank_compare in comparison["top_movers"]:
+        lines.append(f"  {arc_id}: {rank_main} -> {rank_compare}")
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+
+
+class GwDbAdapter:
+    """ Database access used by the engines.
+        get_rows always returns a list (empty when there are no rows) and execute_sql returns a status """
+
+    def get_row(self, sql):
+
+        rows = self.get_rows(sql)
+        return rows[0] if rows else None
+
+
+    def get_rows(self, sql, as_dict=False):
+        raise NotImplementedError
+
+
+    def execute_sql(self, sql):
+        raise NotImplementedError
+
+
+    def execute_autocommit(self, sql):
+        """ Execute @sql outside a transaction block, as needed by VACUUM """
+        raise NotImplementedError
+
+
+    def copy_expert(self, sql, file):
+        """ Execute COPY ... FROM STDIN @sql reading the data from @file """
+        raise NotImplementedError
+
+
+    def _copy_expert(self, conn, sql, file):
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(sql, file)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return True
+
+
+    def _execute_autocommit(self, conn, sql):
+
+        autocommit = conn.autocommit
+        try:
+            conn.commit()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+        finally:
+            conn.autocommit = autocommit
+        return True
+
+
+class GwToolsDbAdapter(GwDbAdapter):
+    """ Adapter over Giswater's 'tools_db', used inside a QGIS session """
+
+    def __init__(self):
+
+        from ...settings import tools_db
+        self.tools_db = tools_db
+
+
+    def get_rows(self, sql, as_dict=False):
+
+        rows = self.tools_db.get_rows(sql) or []
+        if as_dict:
+            rows = [dict(row) for row in rows]
+        return rows
+
+
+    def execute_sql(self, sql):
+        return self.tools_db.execute_sql(sql)
+
+
+    def execute_autocommit(self, sql):
+        """ On a connection of its own: switching the dao connection of the session to autocommit would commit or
+            break what the UI has open on it """
+
+        import psycopg2
+        from ...settings import gw_global_vars
+
+        conn = psycopg2.connect(gw_global_vars.session_vars['dao'].conn_string)
+        try:
+            return self._execute_autocommit(conn, sql)
+        finally:
+            conn.close()
+
+
+    def copy_expert(self, sql, file):
+
+        from ...settings import gw_global_vars
+        return self._copy_expert(gw_global_vars.session_vars['dao'].conn, sql, file)
+
+
+class GwPsycopgAdapter(GwDbAdapter):
+    """ Adapter over a psycopg2 connection, used by the command line and the benchmarks """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+    def get_rows(self, sql, as_dict=False):
+
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(sql)
+                rows = cursor.fetchall() if cursor.description else []
+                if as_dict:
+                    columns = [column[0] for column in cursor.description]
+                    rows = [dict(zip(columns, row)) for row in rows]
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return rows
+
+
+    def execute_sql(self, sql):
+
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(sql)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return True
+
+
+    def execute_autocommit(self, sql):
+        return self._execute_autocommit(self.conn, sql)
+
+
+    def copy_expert(self, sql, file):
+        return self._copy_expert(self.conn, sql, file)
@@ -0,0 +1,42 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from ..utils.task_stats import GwStageRecorder
+
+
+class GwEngineFeedback:
+    """ Progress, report and cancellation channel of an engine run outside QGIS.
+        GwTask implements the same methods (emit_report, set_progress, is_canceled, stage) """
+
+    def __init__(self, task_name, log_function=print, trace_memory=False):
+
+        self.task_name = task_name
+        self.log_function = log_function
+        self.stage_recorder = GwStageRecorder(task_name, log_function, trace_memory)
+        self.messages = []
+        self.progress = 0
+        self.canceled = False
+
+
+    def emit_report(self, *messages):
+
+        for message in messages:
+            self.messages.append(message)
+            if self.log_function and message:
+                self.log_function(message)
+
+
+    def set_progress(self, value):
+        self.progress = value
+
+
+    def is_canceled(self):
+        return self.canceled
+
+
+    def stage(self, stage_name, rows_in=None):
+        return self.stage_recorder.stage(stage_name, rows_in)
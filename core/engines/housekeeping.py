@@ -0,0 +1,165 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import csv
+import gzip
+import os
+from datetime import datetime
+
+# Schema where archived results are kept when archiving to the database
+ARCHIVE_SCHEMA = "asset_archive"
+# Tables holding the rows of a result, parent table first. Children are deleted by the cascading FKs of tablect.sql,
+# except the partitions of arc_engine_sh and arc_output, dropped first (gw_fct_drop_result_partitions in ddl.sql)
+RESULT_TABLES = (
+    "cat_result",
+    "config_diameter",
+    "config_material",
+    "config_engine",
+    "arc_engine_sh",
+    "arc_engine_wm",
+    "arc_output",
+)
+
+
+def format_size(size):
+
+    for unit in ("bytes", "kB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class GwHousekeepingEngine:
+    """ Archive, delete and vacuum priority results.
+        @archive is None, 'schema' (tables of ARCHIVE_SCHEMA) or 'file' (one gzip CSV per table in @archive_folder) """
+
+    def __init__(
+        self, db, feedback, result_ids, archive=None, archive_folder=None, vacuum_full=False
+    ):
+        self.db = db
+        self.feedback = feedback
+        self.result_ids = [int(x) for x in result_ids]
+        self.archive = archive
+        self.archive_folder = archive_folder
+        self.vacuum_full = vacuum_full
+
+    def run(self):
+        try:
+            if not self.result_ids:
+                self.feedback.emit_report("No results to delete.")
+                return False
+
+            str_ids = ",".join(str(x) for x in self.result_ids)
+            self.feedback.set_progress(0)
+
+            with self.feedback.stage("Measuring tables"):
+                size_before = self._get_tables_size()
+
+            if self.archive:
+                self.feedback.emit_report(f"Archiving results ({self.archive})...")
+                with self.feedback.stage("Archiving results") as stats:
+                    if self.archive == "schema":
+                        stats.rows_out = self._archive_to_schema(str_ids)
+                    elif self.archive == "file":
+                        stats.rows_out = self._archive_to_files(str_ids)
+                    else:
+                        raise ValueError(f"Unknown archive mode: '{self.archive}'")
+            self.feedback.set_progress(40)
+
+            if self.feedback.is_canceled():
+                self.feedback.emit_report("Task canceled.")
+                return False
+
+            self.feedback.emit_report("Deleting results...")
+            with self.feedback.stage("Deleting results", rows_in=len(self.result_ids)):
+                # A single call, so the partitions and the results are deleted in the same transaction
+                self.db.execute_sql(
+                    f"""
+                    SELECT asset.gw_fct_drop_result_partitions(ARRAY[{str_ids}]);
+                    DELETE FROM asset.cat_result WHERE result_id IN ({str_ids});
+                    """
+                )
+            self.feedback.set_progress(60)
+
+            self.feedback.emit_report("Vacuuming tables...")
+            with self.feedback.stage("Vacuuming tables"):
+                vacuum = "VACUUM (FULL, ANALYZE)" if self.vacuum_full else "VACUUM (ANALYZE)"
+                for table in RESULT_TABLES:
+                    self.db.execute_autocommit(f"{vacuum} asset.{table}")
+                size_after = self._get_tables_size()
+            self.feedback.set_progress(100)
+
+            reclaimed = size_before - size_after
+            self.feedback.emit_report(
+                f"Deleted results: {len(self.result_ids)}.",
+                f"Size of result tables: {format_size(size_before)} -> {format_size(size_after)} "
+                f"(reclaimed {format_size(reclaimed)}).",
+            )
+            if not self.vacuum_full:
+                self.feedback.emit_report(
+                    "Space freed by VACUUM is reused by new results; "
+                    "use VACUUM FULL to return it to the operating system."
+                )
+            return True
+
+        except Exception as e:
+            self.feedback.emit_report(f"Error: {e}")
+            return False
+
+    def _get_tables_size(self):
+
+        # Partitioned tables have no storage of their own, their partitions are measured instead
+        tables = ",".join(f"'asset.{table}'" for table in RESULT_TABLES)
+        row = self.db.get_row(
+            f"""
+            SELECT sum(pg_total_relation_size(p.relid))
+            FROM unnest(ARRAY[{tables}]) t,
+                pg_partition_tree(to_regclass(t)) p
+            """
+        )
+        return int(row[0] or 0) if row else 0
+
+    def _archive_to_schema(self, str_ids):
+
+        rows = 0
+        self.db.execute_sql(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        for table in RESULT_TABLES:
+            count = self.db.get_row(
+                f"SELECT count(*) FROM asset.{table} WHERE result_id IN ({str_ids})"
+            )[0]
+            self.db.execute_sql(
+                f"""
+                CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table} (LIKE asset.{table});
+                INSERT INTO {ARCHIVE_SCHEMA}.{table}
+                SELECT * FROM asset.{table} WHERE result_id IN ({str_ids});
+                """
+            )
+            rows += count
+        return rows
+
+    def _archive_to_files(self, str_ids):
+
+        os.makedirs(self.archive_folder, exist_ok=True)
+        tstamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        rows = 0
+        for table in RESULT_TABLES:
+            path = os.path.join(self.archive_folder, f"{table}_{tstamp}.csv.gz")
+            with gzip.open(path, "wt", newline="") as f:
+                writer = None
+                # One result at a time, to keep memory bounded
+                for result_id in self.result_ids:
+                    for row in self.db.get_rows(
+                        f"SELECT * FROM asset.{table} WHERE result_id = {result_id}",
+                        as_dict=True,
+                    ):
+                        if writer is None:
+                            writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+                            writer.writeheader()
+                        writer.writerow(row)
+                        rows += 1
+            self.feedback.emit_report(f"Archived table '{table}' to '{path}'.")
+        return rows
@@ -0,0 +1,423 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import csv
+import io
+import os
+import re
+import sqlite3
+import struct
+from datetime import date, datetime
+
+from .leak_stats import refresh as refresh_leak_stats
+
+# SRID of the leaks table
+LEAKS_SRID = 5367
+# Rows sent to the database with every COPY
+BATCH_SIZE = 10000
+# Invalid rows listed in the report
+MAX_ERRORS_REPORTED = 20
+
+# Columns of the file that can be loaded into asset.leaks, when the table has them
+LEAK_COLUMNS = (
+    "ext_code",
+    "address",
+    "province",
+    "county",
+    "district",
+    "system",
+    "zone",
+    "type",
+    "material",
+    "diameter",
+    "startdate",
+    "enddate",
+    "days",
+)
+DATE_COLUMNS = ("startdate", "enddate")
+INTEGER_COLUMNS = ("diameter", "days")
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y")
+# Geometry of CSV files: WKT column or X/Y columns
+CSV_WKT_COLUMNS = ("wkt", "the_geom", "geom", "geometry")
+CSV_X_COLUMNS = ("x", "coord_x", "lon", "longitude")
+CSV_Y_COLUMNS = ("y", "coord_y", "lat", "latitude")
+POINT_WKT = re.compile(r"^\s*POINT\s*Z?M?\s*\(\s*[-+0-9.eE]+\s+[-+0-9.eE]+(\s+[-+0-9.eE]+)*\s*\)\s*$", re.IGNORECASE)
+# Size of the envelope of GeoPackage geometries, by envelope indicator
+GPKG_ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+
+def parse_date(value):
+
+    if value is None or value == "":
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    value = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:10], date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date '{value}'")
+
+
+def parse_integer(value):
+
+    if value is None or value == "":
+        return None
+    number = float(value)
+    if number != int(number):
+        raise ValueError(f"invalid integer '{value}'")
+    return int(number)
+
+
+def point_to_wkb(x, y):
+    """ Hex WKB of a 2D point, accepted by PostGIS as geometry input """
+
+    return struct.pack("<BIdd", 1, 1, float(x), float(y)).hex()
+
+
+def gpkg_to_wkb(blob):
+    """ Hex WKB of a GeoPackage point geometry (GeoPackage header removed) """
+
+    if blob is None:
+        raise ValueError("missing geometry")
+    blob = bytes(blob)
+    if blob[:2] != b"GP":
+        raise ValueError("invalid GeoPackage geometry")
+    flags = blob[3]
+    if flags & 0b10000:
+        raise ValueError("empty geometry")
+    wkb = blob[8 + GPKG_ENVELOPE_SIZES.get((flags >> 1) & 0b111, 0):]
+    geometry_type = struct.unpack("<I" if wkb[0] else ">I", wkb[1:5])[0]
+    # ISO (1001, 2001, 3001) and EWKB (flags in the high bits) points
+    if (geometry_type & 0xFFFF) % 1000 != 1:
+        raise ValueError("geometry is not a point")
+    return wkb.hex()
+
+
+class GwLeakImportEngine:
+    """ Incremental load of leaks from a CSV or GeoPackage file.
+        The file is streamed in batches with COPY to a staging table, validated, reprojected to LEAKS_SRID and
+        merged into asset.leaks by ext_code: leaks already loaded are updated (if @update_existing), new ones
+        are inserted. Nothing is merged if the task is canceled """
+
+    def __init__(
+        self,
+        db,
+        feedback,
+        path,
+        layer=None,
+        source_srid=None,
+        update_existing=True,
+        batch_size=BATCH_SIZE,
+    ):
+        self.db = db
+        self.feedback = feedback
+        self.path = path
+        self.layer = layer
+        self.source_srid = source_srid
+        self.update_existing = update_existing
+        self.batch_size = batch_size
+        self.columns = []
+        self.errors = []
+        self.rows_read = 0
+        self.rows_invalid = 0
+        self.duplicates = 0
+
+    def run(self):
+        try:
+            is_gpkg = os.path.splitext(self.path)[1].lower() == ".gpkg"
+            leak_columns = self._get_leak_columns()
+
+            self.feedback.emit_report(f"Reading '{os.path.basename(self.path)}'...")
+            self.feedback.set_progress(0)
+            reader = self._read_gpkg(leak_columns) if is_gpkg else self._read_csv(leak_columns)
+
+            with self.feedback.stage("Loading staging table") as stats:
+                self._create_staging_table(leak_columns)
+                batch = []
+                for row in reader:
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        self._copy(batch)
+                        batch = []
+                        if self.feedback.is_canceled():
+                            self.feedback.emit_report("Task canceled. No leaks were loaded.")
+                            self._drop_staging_table()
+                            return False
+                if batch:
+                    self._copy(batch)
+                stats.rows_in = self.rows_read
+                stats.rows_out = self.rows_read - self.rows_invalid - self.duplicates
+            self.feedback.set_progress(80)
+
+            if self.source_srid is None:
+                raise ValueError("Unknown SRID of the file")
+
+            with self.feedback.stage("Merging leaks") as stats:
+                updated, inserted = self._merge(leak_columns)
+                stats.rows_out = updated + inserted
+            with self.feedback.stage("Refreshing leak stats"):
+                refresh_leak_stats(self.db)
+            self._drop_staging_table()
+            self.feedback.set_progress(100)
+
+            report = [
+                "Task finished!",
+                f"Rows read: {self.rows_read}.",
+                f"Invalid rows: {self.rows_invalid}.",
+                f"Rows repeated in the file (same ext_code, first one loaded): {self.duplicates}.",
+                f"Leaks updated: {updated}.",
+                f"Leaks inserted: {inserted}.",
+            ]
+            if self.source_srid != LEAKS_SRID:
+                report.append(f"Geometries reprojected from EPSG:{self.source_srid} to EPSG:{LEAKS_SRID}.")
+            if self.errors:
+                report.append("Invalid rows:")
+                report += self.errors
+                if self.rows_invalid > len(self.errors):
+                    report.append(f"... and {self.rows_invalid - len(self.errors)} more.")
+            self.feedback.emit_report(*report)
+            return True
+
+        except Exception as e:
+            self.feedback.emit_report(f"Error: {e}")
+            return False
+
+    def _get_leak_columns(self):
+        """ {column: SQL type} of the columns of asset.leaks that can be loaded """
+
+        rows = self.db.get_rows(
+            """
+            SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            WHERE a.attrelid = 'asset.leaks'::regclass AND a.attnum > 0 AND NOT a.attisdropped
+            """
+        )
+        types = {row[0]: row[1] for row in rows}
+        return {column: types[column] for column in LEAK_COLUMNS if column in types}
+
+    def _validate(self, line, values):
+        """ Row of the staging table from the dict @values of a file row, or None if invalid """
+
+        self.rows_read += 1
+        try:
+            if not values.get("ext_code"):
+                raise ValueError("missing ext_code")
+            ext_code = str(values["ext_code"]).strip()
+            if ext_code in self._ext_codes:
+                self.duplicates += 1
+                return None
+            row = [line]
+            for column in self.columns:
+                value = values.get(column)
+                if column in DATE_COLUMNS:
+                    value = parse_date(value)
+                elif column in INTEGER_COLUMNS:
+                    value = parse_integer(value)
+                elif column == "ext_code":
+                    value = ext_code
+                elif value is not None:
+                    value = str(value).strip()
+                row.append(value)
+            if row[1 + self.columns.index("startdate")] is None:
+                raise ValueError("missing startdate")
+            row.append(values["geometry"]())
+            self._ext_codes.add(ext_code)
+            return row
+
+        except (ValueError, TypeError, OverflowError, struct.error) as e:
+            self.rows_invalid += 1
+            if len(self.errors) < MAX_ERRORS_REPORTED:
+                self.errors.append(f"  Row {line}: {e}.")
+            return None
+
+    def _read_csv(self, leak_columns):
+
+        size = os.path.getsize(self.path) or 1
+        with open(self.path, "rb") as raw:
+            f = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+            sample = f.read(8192)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(f, dialect)
+            header = [name.strip().lower() for name in next(reader)]
+            self._set_columns(header, leak_columns)
+
+            wkt = next((header.index(c) for c in CSV_WKT_COLUMNS if c in header), None)
+            x = next((header.index(c) for c in CSV_X_COLUMNS if c in header), None)
+            y = next((header.index(c) for c in CSV_Y_COLUMNS if c in header), None)
+            if wkt is None and (x is None or y is None):
+                raise ValueError("The file needs a WKT column or X and Y columns")
+            if self.source_srid is None:
+                self.source_srid = LEAKS_SRID
+
+            def get_geometry(values):
+                if wkt is not None:
+                    if not POINT_WKT.match(values[wkt]):
+                        raise ValueError(f"invalid point '{values[wkt]}'")
+                    return values[wkt].strip()
+                return point_to_wkb(values[x], values[y])
+
+            for line, values in enumerate(reader, start=2):
+                if not values:
+                    continue
+                if len(values) < len(header):
+                    values += [""] * (len(header) - len(values))
+                data = dict(zip(header, values))
+                data["geometry"] = lambda values=values: get_geometry(values)
+                row = self._validate(line, data)
+                if row is not None:
+                    yield row
+                if line % self.batch_size == 0:
+                    self.feedback.set_progress(80 * raw.tell() / size)
+
+    def _read_gpkg(self, leak_columns):
+
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            table = self.layer
+            if table is None:
+                row = conn.execute(
+                    "SELECT table_name FROM gpkg_contents WHERE data_type = 'features' ORDER BY table_name"
+                ).fetchone()
+                if row is None:
+                    raise ValueError("The GeoPackage has no layers")
+                table = row[0]
+            row = conn.execute(
+                """
+                SELECT g.column_name, s.organization, s.organization_coordsys_id, g.srs_id
+                FROM gpkg_geometry_columns g
+                LEFT JOIN gpkg_spatial_ref_sys s USING (srs_id)
+                WHERE g.table_name = ?
+                """,
+                (table,),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Layer '{table}' not found")
+            geometry_column, organization, coordsys_id, srs_id = row
+            if self.source_srid is None:
+                is_epsg = (organization or "").upper() == "EPSG"
+                self.source_srid = int(coordsys_id if is_epsg else srs_id)
+
+            total = conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0] or 1
+            cursor = conn.execute(f'SELECT * FROM "{table}"')
+            header = [column[0].lower() for column in cursor.description]
+            self._set_columns(header, leak_columns)
+            geometry_index = header.index(geometry_column.lower())
+
+            line = 0
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for values in rows:
+                    line += 1
+                    data = dict(zip(header, values))
+                    data["geometry"] = lambda values=values: gpkg_to_wkb(values[geometry_index])
+                    row = self._validate(line, data)
+                    if row is not None:
+                        yield row
+                self.feedback.set_progress(80 * line / total)
+        finally:
+            conn.close()
+
+    def _set_columns(self, header, leak_columns):
+
+        self.columns = [column for column in leak_columns if column in header]
+        self._ext_codes = set()
+        for column in ("ext_code", "startdate"):
+            if column not in self.columns:
+                raise ValueError(f"The file needs a column '{column}'")
+
+    def _create_staging_table(self, leak_columns):
+
+        columns = ", ".join(f"{column} text" for column in leak_columns)
+        self.db.execute_sql(
+            f"""
+            DROP TABLE IF EXISTS pg_temp.leaks_import;
+            CREATE TEMP TABLE pg_temp.leaks_import (line integer, {columns}, the_geom geometry);
+            """
+        )
+
+    def _drop_staging_table(self):
+        self.db.execute_sql("DROP TABLE IF EXISTS pg_temp.leaks_import")
+
+    def _copy(self, batch):
+
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        self.db.copy_expert(
+            f"COPY pg_temp.leaks_import (line, {', '.join(self.columns)}, the_geom) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+    def _merge(self, leak_columns):
+        """ Update the leaks already loaded and insert the new ones. Return (updated, inserted) """
+
+        values = {
+            column: f"nullif(s.{column}, '')::{leak_columns[column]}" for column in self.columns
+        }
+        geometry = "ST_Force2D(s.the_geom)"
+        if self.source_srid != LEAKS_SRID:
+            geometry = f"ST_Transform(ST_SetSRID({geometry}, {int(self.source_srid)}), {LEAKS_SRID})"
+        else:
+            geometry = f"ST_SetSRID({geometry}, {LEAKS_SRID})"
+
+        # Materials not in the catalog would break the foreign key of asset.leaks
+        unknown_materials = []
+        if "material" in self.columns:
+            unknown_materials = [
+                row[0]
+                for row in self.db.get_rows(
+                    """
+                    SELECT DISTINCT material FROM pg_temp.leaks_import
+                    WHERE nullif(material, '') IS NOT NULL
+                        AND material NOT IN (SELECT id FROM asset.cat_mat_arc)
+                    """
+                )
+            ]
+            if unknown_materials:
+                self.feedback.emit_report(
+                    f"Materials not found in cat_mat_arc, loaded as NULL: {', '.join(unknown_materials)}."
+                )
+                values["material"] = (
+                    "CASE WHEN s.material IN (SELECT id FROM asset.cat_mat_arc) "
+                    f"THEN s.material END::{leak_columns['material']}"
+                )
+
+        exists = "EXISTS (SELECT 1 FROM asset.leaks l WHERE l.ext_code = s.ext_code)"
+        existing = self.db.get_row(f"SELECT count(*) FROM pg_temp.leaks_import s WHERE {exists}")[0]
+        updated = existing if self.update_existing else 0
+        if existing and not self.update_existing:
+            self.feedback.emit_report(f"Leaks already loaded, not updated: {existing}.")
+        inserted = self.db.get_row(f"SELECT count(*) FROM pg_temp.leaks_import s WHERE NOT {exists}")[0]
+
+        sql = ""
+        if updated:
+            assignments = ", ".join(f"{column} = {value}" for column, value in values.items())
+            sql += f"""
+                UPDATE asset.leaks l SET {assignments}, the_geom = {geometry}
+                FROM pg_temp.leaks_import s
+                WHERE l.ext_code = s.ext_code;
+            """
+        if inserted:
+            sql += f"""
+                INSERT INTO asset.leaks ({", ".join(values)}, the_geom)
+                SELECT {", ".join(values.values())}, {geometry}
+                FROM pg_temp.leaks_import s
+                WHERE NOT {exists}
+                ORDER BY s.line;
+            """
+        if sql:
+            self.db.execute_sql(sql)
+        return updated, inserted
@@ -0,0 +1,49 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+
+# Leak history read from asset.leaks_stats (one row per year, kept by the triggers on asset.leaks),
+# so the engines don't scan the leaks table to know its dates.
+# The leaks table is read instead while the stats are empty (e.g. schemas older than the triggers not refreshed yet)
+
+# Date of the newest leak, to use inside queries. The second subquery only runs if the first one is NULL
+MAX_DATE_SQL = """coalesce(
+    (SELECT max(max_date) FROM asset.leaks_stats),
+    (SELECT max(startdate) FROM asset.leaks))"""
+
+
+def get_leak_dates(db):
+    """ (max_date, min_date, interval in days) of the leaks """
+
+    row = db.get_row(
+        """
+        SELECT max(max_date), min(min_date), max(max_date) - min(min_date)
+        FROM asset.leaks_stats
+        """
+    )
+    if row is not None and row[0] is not None:
+        return row
+    return db.get_row(
+        """
+        SELECT max(startdate), min(startdate), max(startdate) - min(startdate)
+        FROM asset.leaks
+        """
+    )
+
+
+def get_last_leak_year(db):
+
+    year = db.get_row("SELECT max(year) FROM asset.leaks_stats")[0]
+    if year is not None:
+        return year
+    return db.get_row("SELECT date_part('year', max(startdate))::integer FROM asset.leaks")[0]
+
+
+def refresh(db):
+    """ Rebuild the stats from the leaks table, so they also count the leaks loaded before the triggers existed """
+
+    return db.execute_sql("SELECT asset.gw_fct_refresh_leaks_stats()")
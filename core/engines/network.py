@@ -0,0 +1,185 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import threading
+
+import numpy as np
+
+# Pipes with the data used by the engines, same rows as the pipe query of the priority engine
+NETWORK_SQL = """
+    SELECT a.arc_id,
+        a.matcat_id,
+        a.dnom,
+        coalesce(ai.length, ST_LENGTH(a.the_geom)),
+        coalesce(ai.rleak, 0),
+        a.expl_id,
+        a.presszone_id,
+        ai.plan,
+        ai.social,
+        ai.other
+    FROM asset.arc_asset a
+    LEFT JOIN asset.arc_input ai USING (arc_id)
+"""
+# Version of the pipes, raised by a trigger on every statement that changes arc_asset or arc_input (see ddl.sql).
+# The database is part of the signature, for projects of other databases opened in the same session
+VERSION_SQL = "SELECT current_database(), version FROM asset.network_version"
+
+_network = None
+_lock = threading.Lock()
+
+
+def _encode(values):
+    """ Categorical encoding of strings: (codes, categories). NULL is code -1 """
+
+    categories = sorted({value for value in values if value is not None})
+    index = {category: code for code, category in enumerate(categories)}
+    codes = np.array([index.get(value, -1) for value in values], dtype=np.int32)
+    return codes, categories
+
+
+def _encode_boolean(values):
+    """ NULL is -1 """
+    return np.array([-1 if value is None else int(value) for value in values], dtype=np.int8)
+
+
+def _encode_number(values):
+    """ NULL is NaN """
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+class GwNetworkSnapshot:
+    """ Columnar copy of the pipes of the network, with strings encoded as categories.
+        Read once per session and shared by the tasks until the tables change (see get_network) """
+
+    __slots__ = (
+        "signature",
+        "arc_id",
+        "material",
+        "materials",
+        "dnom",
+        "length",
+        "rleak",
+        "expl_id",
+        "presszone",
+        "presszones",
+        "plan",
+        "social",
+        "other",
+    )
+
+    def __init__(self, rows, signature=None):
+
+        columns = list(zip(*rows)) if rows else [()] * 10
+        self.signature = signature
+        self.arc_id = np.array(columns[0], dtype=np.int64)
+        self.material, self.materials = _encode(columns[1])
+        self.dnom = _encode_number(columns[2])
+        self.length = _encode_number(columns[3])
+        self.rleak = _encode_number([float(x) if x is not None else None for x in columns[4]])
+        self.expl_id = _encode_number(columns[5])
+        self.presszone, self.presszones = _encode(columns[6])
+        self.plan = _encode_boolean(columns[7])
+        self.social = _encode_boolean(columns[8])
+        self.other = _encode_boolean(columns[9])
+
+    def __len__(self):
+        return len(self.arc_id)
+
+    def get_mask(self, features=None, exploitation=None, presszone=None, diameter=None, material=None):
+        """ Pipes matching the filters of a priority calculation """
+
+        mask = np.ones(len(self), dtype=bool)
+        if features:
+            mask &= np.isin(self.arc_id, [int(x) for x in features])
+        if exploitation:
+            mask &= self.expl_id == float(exploitation)
+        if presszone:
+            mask &= self.presszone == self._get_code(self.presszones, presszone)
+        if diameter:
+            mask &= self.dnom == float(diameter)
+        if material:
+            mask &= self.material == self._get_code(self.materials, material)
+        return mask
+
+    def get_rows(self, mask=None):
+        """ Rows of NETWORK_SQL: (arc_id, matcat_id, dnom, length, rleak, expl_id, presszone_id, plan, social, other) """
+
+        index = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+
+        def decode(codes, categories):
+            return [categories[code] if code >= 0 else None for code in codes[index].tolist()]
+
+        def decode_integer(values):
+            return [None if value != value else int(value) for value in values[index].tolist()]
+
+        def decode_float(values):
+            return [None if value != value else value for value in values[index].tolist()]
+
+        def decode_boolean(values):
+            return [None if value < 0 else bool(value) for value in values[index].tolist()]
+
+        return list(
+            zip(
+                self.arc_id[index].tolist(),
+                decode(self.material, self.materials),
+                decode_integer(self.dnom),
+                decode_float(self.length),
+                decode_float(self.rleak),
+                decode_integer(self.expl_id),
+                decode(self.presszone, self.presszones),
+                decode_boolean(self.plan),
+                decode_boolean(self.social),
+                decode_boolean(self.other),
+            )
+        )
+
+    def get_lengths(self):
+        """ (arc_id, length) of every pipe, as ARC_LENGTHS_SQL of the assignation """
+
+        return list(zip(self.arc_id.tolist(), [None if x != x else x for x in self.length.tolist()]))
+
+    @staticmethod
+    def _get_code(categories, value):
+
+        try:
+            return categories.index(str(value))
+        except ValueError:
+            return -2
+
+
+def get_signature(db):
+    """ (database, version) of the pipes of the network, None if the schema has no network_version """
+
+    row = db.get_row(VERSION_SQL)
+    return tuple(row) if row else None
+
+
+def get_network(db, reload=False):
+    """ Return the snapshot of the network, read again only if its version changed since it was read """
+
+    global _network
+
+    # Read before the pipes: a change committed in between makes the next call read them again
+    signature = get_signature(db)
+    with _lock:
+        if _network is not None and not reload and signature is not None and _network.signature == signature:
+            return _network
+
+    network = GwNetworkSnapshot(db.get_rows(NETWORK_SQL), signature)
+    with _lock:
+        _network = network
+    return network
+
+
+def invalidate():
+    """ Forget the snapshot. Called by the tasks that change the network, so the next read doesn't depend on
+        the version of a schema where the triggers may be missing """
+
+    global _network
+
+    with _lock:
+        _network = None
@@ -0,0 +1,580 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from math import log, log1p, exp
+
+from .leak_stats import get_last_leak_year
+from ..utils.diameter_bands import GwDiameterBands
+
+
+def optimal_replacement_time(
+    present_year,
+    number_of_breaks,
+    break_growth_rate,
+    repairing_cost,
+    replacement_cost,
+    discount_rate,
+):
+    BREAKS_YEAR_0 = 0.05
+    optimal_replacement_cycle = (1 / break_growth_rate) * log(
+        log1p(discount_rate) * replacement_cost / BREAKS_YEAR_0 / repairing_cost
+    )
+    cycle_costs = 0
+    for t in range(1, round(optimal_replacement_cycle) + 1):
+        # print(cycle_costs)
+        cycle_costs += (
+            repairing_cost
+            * BREAKS_YEAR_0
+            * exp(break_growth_rate * t)
+            / (1 + discount_rate) ** t
+        )
+
+    b_orc = 1 / ((1 + discount_rate) ** optimal_replacement_cycle - 1)
+
+    return present_year + (1 / break_growth_rate) * log(
+        log1p(discount_rate)
+        # * replacement_cost
+        * ((replacement_cost + cycle_costs) * b_orc + replacement_cost)
+        / number_of_breaks
+        / repairing_cost
+    )
+
+
+class GwPriorityEngine:
+    """ Calculate replacement priority of pipes and save it as a new result.
+        Free of QGIS: database access goes through @db (see engines.db) and progress through @feedback.
+        With @use_network_snapshot pipes are read from the session snapshot of the network (see engines.network) """
+
+    def __init__(
+        self,
+        db,
+        feedback,
+        method,
+        result_type,
+        result_name,
+        result_description,
+        features,
+        exploitation,
+        presszone,
+        diameter,
+        material,
+        budget,
+        target_year,
+        config_diameter,
+        config_material,
+        config_engine,
+        use_network_snapshot=False,
+        diameter_bands=None,
+    ):
+        self.db = db
+        self.feedback = feedback
+        self.method = method
+        self.result_type = result_type
+        self.result_name = result_name
+        self.result_description = result_description
+        self.features = features
+        self.exploitation = exploitation
+        self.presszone = presszone
+        self.diameter = diameter
+        self.material = material
+        self.result_budget = budget
+        self.result_target_year = target_year
+        self.config_diameter = config_diameter
+        self.config_material = config_material
+        self.config_engine = config_engine
+        self.use_network_snapshot = use_network_snapshot
+        self.diameter_bands = diameter_bands or GwDiameterBands(config_diameter)
+
+    def run(self):
+        try:
+            if self.method == "SH":
+                return self._run_sh()
+            elif self.method == "WM":
+                return self._run_wm()
+            else:
+                raise ValueError("The method is not defined in the configuration file.")
+
+        except Exception as e:
+            self.feedback.emit_report(f"Error: {e}")
+            return False
+
+    def _run_sh(self):
+        self.feedback.emit_report("Getting auxiliary data from DB (1/5)...")
+        self.feedback.set_progress(0)
+
+        discount_rate = float(self.config_engine["drate"])
+        break_growth_rate = float(self.config_engine["bratemain0"])
+
+        with self.feedback.stage("Getting auxiliary data"):
+            last_leak_year = get_last_leak_year(self.db)
+
+        if self.feedback.is_canceled():
+            self.feedback.emit_report("Task canceled.")
+            return False
+        self.feedback.emit_report("Getting pipe data from DB (2/5)...")
+        self.feedback.set_progress(20)
+
+        with self.feedback.stage("Getting pipe data") as stats:
+            if self.use_network_snapshot:
+                arcs = self._get_snapshot_arcs()
+            else:
+                arcs = self._get_arcs()
+            stats.rows_out = len(arcs) if arcs else 0
+
+        if not arcs:
+            self.feedback.emit_report(
+                "Task canceled:", "No pipes to process with selected filters."
+            )
+            return False
+
+        if self.feedback.is_canceled():
+            self.feedback.emit_report("Task canceled.")
+            return False
+        self.feedback.emit_report("Calculating values (3/5)...")
+        self.feedback.set_progress(40)
+
+        with self.feedback.stage("Calculating values", rows_in=len(arcs)) as stats:
+            diameter_bands = self.diameter_bands
+            output_arcs = []
+            for arc in arcs:
+                (
+                    arc_id,
+                    arc_material,
+                    arc_diameter,
+                    arc_length,
+                    rleak,
+                    expl_id,
+                    presszone_id,
+                    plan,
+                    social,
+                    other,
+                ) = arc
+                if not diameter_bands.is_valid(arc_diameter):
+                    continue
+                if arc_length is None:
+                    continue
+                if self.exploitation and self.exploitation != expl_id:
+                    continue
+                if self.presszone and self.presszone != presszone_id:
+                    continue
+                if self.diameter and self.diameter != arc_diameter:
+                    continue
+                if self.material and self.material != arc_material:
+                    continue
+
+                reference_dnom = diameter_bands.get_reference(arc_diameter)
+                cost_repmain = self.config_diameter[reference_dnom]["cost_repmain"]
+
+                replacement_cost = self.config_diameter[reference_dnom]["cost_constr"]
+                cost_constr = replacement_cost * float(arc_length)
+
+                material_compliance = 10
+                if (
+                    arc_material in self.config_material
+                    and self.config_material[arc_material]
+                ):
+                    material_compliance = self.config_material[arc_material]["compliance"]
+
+                compliance = 10 - min(
+                    self.config_diameter[reference_dnom]["compliance"],
+                    material_compliance,
+                )
+
+                strategic = 10 if plan or social or other else 0
+
+                if rleak == 0 or rleak is None:
+                    year = None
+                else:
+                    year = int(
+                        optimal_replacement_time(
+                            last_leak_year,
+                            float(rleak),
+                            break_growth_rate,
+                            cost_repmain,
+                            replacement_cost * 1000,
+                            discount_rate,
+                        )
+                    )
+                output_arcs.append(
+                    [
+                        arc_id,
+                        cost_repmain,
+                        cost_constr,
+                        break_growth_rate,
+                        year,
+                        compliance,
+                        strategic,
+                    ]
+                )
+            if not len(output_arcs):
+                self.feedback.emit_report(
+                    "Task canceled:", "No pipes to process with selected filters."
+                )
+                return False
+
+            self.feedback.set_progress(50)
+
+            years = [x[4] for x in output_arcs if x[4]]
+            min_year = min(years) if years else None
+            max_year = max(years) if years else None
+
+            for arc in output_arcs:
+                _, _, _, _, year, compliance, strategic = arc
+                year_order = 0
+                if max_year and min_year:
+                    year_order = 10 * (
+                        1 - ((year or max_year) - min_year) / (max_year - min_year)
+                    )
+                val = (
+                    year_order * self.config_engine["expected_year"]
+                    + compliance * self.config_engine["compliance"]
+                    + strategic * self.config_engine["strategic"]
+                )
+                arc.extend([year_order, val])
+            stats.rows_out = len(output_arcs)
+
+        if self.feedback.is_canceled():
+            self.feedback.emit_report("Task canceled.")
+            return False
+        self.feedback.emit_report("Updating tables (4/5)...")
+        self.feedback.set_progress(60)
+
+        with self.feedback.stage("Updating tables", rows_in=len(output_arcs)):
+            sql = f"select result_id from asset.cat_result where result_name = '{self.result_name}'"
+            result_id = self.db.get_row(sql)
+            if result_id is not None:
+                self.feedback.emit_report("This result name already exist.")
+                return False
+
+            str_features = (
+                f"""ARRAY['{"','".join(self.features)}']""" if self.features else "NULL"
+            )
+            str_presszone_id = f"'{self.presszone}'" if self.presszone else "NULL"
+            str_material_id = f"'{self.material}'" if self.material else "NULL"
+            self.db.execute_sql(
+                f"""
+                insert into asset.cat_result (result_name, 
+                    result_type, 
+                    descript,
+                    features,
+                    expl_id,
+                    presszone_id,
+                    dnom,
+                    material_id,
+                    budget,
+                    target_year,
+                    cur_user,
+                    tstamp)
+                values ('{self.result_name}',
+                    '{self.result_type}',
+                    '{self.result_description}',
+                    {str_features},
+                    {self.exploitation or 'NULL'},
+                    {str_presszone_id},
+                    {self.diameter or 'NULL'},
+                    {str_material_id},
+                    NULL,
+                    NULL,
+                    current_user,
+                    now())
+                """
+            )
+
+            self.feedback.set_progress(63)
+
+            sql = f"select result_id from asset.cat_result where result_name = '{self.result_name}'"
+            result_id = self.db.get_row(sql)[0]
+            self.db.execute_sql(f"select asset.gw_fct_create_result_partitions({result_id})")
+
+            config_diameter_fields = list(self.config_diameter.values())[0].keys()
+            save_config_diameter_sql = f"""
+                delete from asset.config_diameter where result_id = {result_id};
+                insert into asset.config_diameter 
+                    (result_id, dnom, {','.join(config_diameter_fields)})
+                values
+            """
+            for dnom, fields in self.config_diameter.items():
+                save_config_diameter_sql += f"""
+                    ({result_id},{dnom},{','.join([str(fields[x]) for x in config_diameter_fields])}),
+                """
+            save_config_diameter_sql = save_config_diameter_sql.strip()[:-1]
+            self.db.execute_sql(save_config_diameter_sql)
+
+            self.feedback.set_progress(66)
+
+            config_material_fields = list(self.config_material.values())[0].keys()
+            save_config_material_sql = f"""
+                delete from asset.config_material where result_id = {result_id};
+                insert into asset.config_material 
+                    (result_id, material, {','.join(config_material_fields)})
+                values
+            """
+            for material, fields in self.config_material.items():
+                save_config_material_sql += f"""
+                    ({result_id},'{material}',{','.join([str(fields[x]) for x in config_material_fields])}),
+                """
+            save_config_material_sql = save_config_material_sql.strip()[:-1]
+            self.db.execute_sql(save_config_material_sql)
+
+            self.feedback.set_progress(69)
+
+            save_config_engine_sql = f"""
+                delete from asset.config_engine where result_id = {result_id};
+                insert into asset.config_engine
+                    (result_id, parameter, value)
+                values
+            """
+            for k, v in self.config_engine.items():
+                save_config_engine_sql += f"({result_id}, '{k}', {v}),"
+            save_config_engine_sql = save_config_engine_sql.strip()[:-1]
+            self.db.execute_sql(save_config_engine_sql)
+
+            self.feedback.set_progress(72)
+
+            self.db.execute_sql(
+                f"delete from asset.arc_engine_sh where result_id = {result_id};"
+            )
+            index = 0
+            loop = 0
+            ended = False
+            while not ended:
+                save_arcs_sql = f"""
+                    insert into asset.arc_engine_sh (
+                        arc_id,
+                        result_id,
+                        cost_repmain,
+                        cost_leak,
+                        cost_constr,
+                        bratemain,
+                        year,
+                        compliance,
+                        strategic,
+                        year_order,
+                        val
+                    ) values 
+                """
+                for i in range(1000):
+                    try:
+                        (
+                            arc_id,
+                            cost_repmain,
+                            cost_constr,
+                            break_growth_rate,
+                            year,
+                            compliance,
+                            strategic,
+                            year_order,
+                            val,
+                        ) = output_arcs[index]
+                        save_arcs_sql += f"""
+                            ({arc_id},
+                            {result_id},
+                            {cost_repmain},
+                            {cost_repmain},
+                            {cost_constr},
+                            {break_growth_rate},
+                            {year or 'NULL'},
+                            {compliance},
+                            {strategic},
+                            {year_order},
+                            {val}),
+                        """
+                        index += 1
+                    except IndexError:
+                        ended = True
+                        break
+                save_arcs_sql = save_arcs_sql.strip()[:-1]
+                self.db.execute_sql(save_arcs_sql)
+                loop += 1
+                progress = (76 - 72) / len(output_arcs) * 1000 * loop + 72
+                self.feedback.set_progress(progress)
+
+            self.db.execute_sql(
+                f"""
+                delete from asset.arc_output
+                    where result_id = {result_id};
+                insert into asset.arc_output (arc_id,
+                        result_id,
+                        val,
+                        orderby,
+                        expected_year,
+                        budget,
+                        total,
+                        length,
+                        cum_length,
+                        mandatory)
+                    select arc_id,
+                        sh.result_id,
+                        val,
+                        rank()
+                            over (order by coalesce(i.mandatory, false) desc, val desc),
+                        year,
+                        cost_constr,
+                        sum(cost_constr)
+                            over (order by coalesce(i.mandatory, false) desc, val desc, arc_id)
+                            as total,
+                        coalesce(i.length, st_length(a.the_geom)),
+                        sum(coalesce(i.length, st_length(a.the_geom)))
+                            over (order by coalesce(i.mandatory, false) desc, val desc, arc_id),
+                        mandatory
+                    from asset.arc_engine_sh sh
+                    left join asset.arc_input i using (arc_id)
+                    left join asset.arc_asset a using (arc_id)
+                    where sh.result_id = {result_id}
+                    order by total;
+                """
+            )
+
+        if self.feedback.is_canceled():
+            self.feedback.emit_report("Task canceled.")
+            return False
+        self.feedback.emit_report("Generating result stats (5/5)...")
+        self.feedback.set_progress(80)
+
+        with self.feedback.stage("Generating result stats"):
+            invalid_diameters_count = self.db.get_row(
+                f"""
+                select count(*)
+                from asset.arc_asset
+                where dnom is null 
+                    or dnom <= 0
+                    or dnom > (
+                        select max(dnom)
+                        from asset.config_diameter
+                        where result_id = {result_id}
+                    )
+                """
+            )[0]
+
+            invalid_diameters = []
+            if invalid_diameters_count:
+                invalid_diameters = [
+                    x[0]
+                    for x in self.db.get_rows(
+                        f"""
+                        select distinct dnom
+                        from asset.arc_asset
+                        where dnom is null 
+                            or dnom <= 0
+                            or dnom > (
+                                select max(dnom)
+                                from asset.config_diameter
+                                where result_id = {result_id}
+                            )
+                        """
+                    )
+                ]
+
+            invalid_materials_count = self.db.get_row(
+                f"""
+                select count(*)
+                from asset.arc_asset a
+                where not exists (
+                    select 1
+                    from asset.config_material
+                    where 
+                        material = a.matcat_id
+                        and result_id = {result_id}
+                )
+                """
+            )[0]
+
+            invalid_materials = []
+            if invalid_materials_count:
+                invalid_materials = [
+                    x[0]
+                    for x in self.db.get_rows(
+                        f"""
+                        select distinct matcat_id
+                        from asset.arc_asset a
+                        where not exists (
+                            select 1
+                            from asset.config_material
+                            where 
+                                material = a.matcat_id
+                                and result_id = {result_id}
+                        )
+                        """
+                    )
+                ]
+
+        if self.feedback.is_canceled():
+            self.feedback.emit_report("Task canceled.")
+            return False
+
+        self.feedback.emit_report(
+            "Task finished!",
+            "Warnings:" if invalid_diameters_count or invalid_materials_count else "",
+        )
+
+        if invalid_diameters_count:
+            self.feedback.emit_report(
+                f"Pipes with invalid diameters: {invalid_diameters_count}.",
+                f"Invalid diameters: {', '.join(map(lambda x: 'NULL' if x is None else str(x), invalid_diameters))}.",
+                "These pipes WERE NOT assigned a priority value.",
+            )
+
+        if invalid_materials_count:
+            self.feedback.emit_report(
+                f"Pipes with invalid materials: {invalid_materials_count}.",
+                f"Invalid materials: {', '.join(map(lambda x: 'NULL' if x is None else str(x), invalid_materials))}.",
+                "These pipes were assigned as compliant by default, "
+                + "which may result in a lower priority value.",
+            )
+
+        return True
+
+    def _get_arcs(self):
+        """ Pipes matching the filters """
+
+        sql = """
+            select a.arc_id,
+                a.matcat_id,
+                a.dnom,
+                coalesce(ai.length, st_length(a.the_geom)) length,
+                coalesce(ai.rleak, 0) rleak, 
+                a.expl_id,
+                a.presszone_id,
+                ai.plan,
+                ai.social,
+                ai.other
+            from asset.arc_asset a 
+            left join asset.arc_input ai using (arc_id)
+            """
+        filters = []
+        if self.features:
+            filters.append(f"""a.arc_id in ('{"','".join(self.features)}')""")
+        if self.exploitation:
+            filters.append(f"a.expl_id = {self.exploitation}")
+        if self.presszone:
+            filters.append(f"a.presszone_id = '{self.presszone}'")
+        if self.diameter:
+            filters.append(f"a.dnom = {self.diameter}")
+        if self.material:
+            filters.append(f"a.matcat_id = '{self.material}'")
+        if filters:
+            sql += f"where {' and '.join(filters)}"
+        return self.db.get_rows(sql)
+
+    def _get_snapshot_arcs(self):
+        """ Pipes matching the filters, from the session snapshot of the network """
+
+        # Only imported when used, it needs numpy
+        try:
+            from .network import get_network
+        except ImportError:
+            self.feedback.emit_report("The network snapshot needs numpy. Reading the pipes from the database...")
+            return self._get_arcs()
+
+        network = get_network(self.db)
+        mask = network.get_mask(
+            self.features, self.exploitation, self.presszone, self.diameter, self.material
+        )
+        return network.get_rows(mask)
+
+    def _run_wm(self):
+        pass
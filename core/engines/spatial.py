@@ -0,0 +1,214 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from datetime import date
+
+
+def subtract_years(day, years):
+    """ Same as PostgreSQL '@day - INTERVAL '@years year'': 29 February becomes 28 February """
+
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def _to_bytes(wkb):
+    return bytes(wkb) if wkb is not None else None
+
+
+class GwLeakSnapshot:
+    """ Leaks and pipes downloaded once as WKB and queried locally with a Shapely 2 STRtree.
+        The same snapshot answers assignations with any buffer and number of years """
+
+    def __init__(self, leaks, arcs):
+        """
+        :param leaks: rows of (id, startdate, diameter, material, wkb)
+        :param arcs: rows of (arc_id, dnom, matcat_id, length, wkb)
+        """
+        try:
+            import numpy as np
+            import shapely
+        except ImportError:
+            raise RuntimeError("Local spatial mode requires numpy and Shapely 2")
+        if int(shapely.__version__.split(".")[0]) < 2:
+            raise RuntimeError(f"Local spatial mode requires Shapely 2 (found {shapely.__version__})")
+
+        self.np = np
+        self.shapely = shapely
+
+        # Leaks without date are never assigned
+        leaks = [row for row in leaks if row[1] is not None]
+        self.leak_id = np.array([row[0] for row in leaks], dtype=np.int64)
+        self.leak_date = np.array([row[1] for row in leaks], dtype="datetime64[D]")
+        self.leak_diameter = [row[2] for row in leaks]
+        self.leak_material = [row[3] for row in leaks]
+        self.leak_geom = shapely.from_wkb([_to_bytes(row[4]) for row in leaks])
+
+        self.arc_rows = [(row[0], row[3]) for row in arcs]
+        self.arc_id = np.array([row[0] for row in arcs], dtype=np.int64)
+        self.arc_diameter = [row[1] for row in arcs]
+        self.arc_material = [row[2] for row in arcs]
+        self.arc_geom = shapely.from_wkb([_to_bytes(row[4]) for row in arcs])
+        self.tree = shapely.STRtree(self.arc_geom)
+        self._arc_ends = None
+
+
+    @classmethod
+    def download(cls, db):
+        """ Read every leak and pipe of the network in two queries """
+
+        leaks = db.get_rows(
+            """
+            SELECT id, startdate, diameter, material, ST_AsBinary(the_geom)
+            FROM asset.leaks
+            """
+        )
+        arcs = db.get_rows(
+            """
+            SELECT a.arc_id, a.dnom, a.matcat_id, coalesce(i.length, ST_LENGTH(a.the_geom)), ST_AsBinary(a.the_geom)
+            FROM asset.arc_asset a
+            LEFT JOIN asset.arc_input i USING (arc_id)
+            """
+        )
+        return cls(leaks, arcs)
+
+
+    def get_leak_dates(self):
+        """ Same as the SQL of the assignation: (max_date, min_date, interval in days) """
+
+        if not len(self.leak_date):
+            return None, None, None
+        max_date = self.leak_date.max().astype(date)
+        min_date = self.leak_date.min().astype(date)
+        return max_date, min_date, (max_date - min_date).days
+
+
+    def get_period_mask(self, years):
+        """ Leaks newer than @years before the last leak """
+
+        max_date = self.leak_date.max().astype(date)
+        return self.leak_date > self.np.datetime64(subtract_years(max_date, years))
+
+
+    def get_leaks(self, years):
+        return self.leak_id[self.get_period_mask(years)].tolist()
+
+
+    def get_candidate_pairs(self, buffer, leak_mask=None):
+        """ Indexes of (leak, pipe) pairs within @buffer and their distances, for leaks in @leak_mask """
+
+        np = self.np
+        shapely = self.shapely
+        leak_index = np.arange(len(self.leak_id))
+        if leak_mask is not None:
+            leak_index = leak_index[leak_mask]
+        input_index, arc_index = self.tree.query(
+            self.leak_geom[leak_index], predicate="dwithin", distance=buffer
+        )
+        leak_index = leak_index[input_index]
+        distance = shapely.distance(self.leak_geom[leak_index], self.arc_geom[arc_index])
+        return leak_index, arc_index, distance
+
+
+    def get_buffer_lengths(self, buffer, leak_index, arc_index):
+        """ Length of every pipe inside the buffer of its leak, as ST_LENGTH(ST_INTERSECTION(ST_BUFFER())) """
+
+        shapely = self.shapely
+        buffers = shapely.buffer(self.leak_geom[leak_index], buffer, quad_segs=8)
+        return shapely.length(shapely.intersection(buffers, self.arc_geom[arc_index]))
+
+
+    def _get_arc_ends(self):
+        """ Length, first point, last point and unit direction of the first and last segment of every pipe """
+
+        if self._arc_ends is None:
+            np = self.np
+            shapely = self.shapely
+
+            def get_xy(index):
+                points = shapely.get_point(self.arc_geom, index)
+                return np.column_stack((shapely.get_x(points), shapely.get_y(points)))
+
+            def get_direction(a, b):
+                vector = b - a
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    return np.nan_to_num(vector / np.hypot(vector[:, 0], vector[:, 1])[:, None])
+
+            start, end = get_xy(0), get_xy(-1)
+            self._arc_ends = (
+                shapely.length(self.arc_geom),
+                start,
+                get_direction(start, get_xy(1)),
+                end,
+                get_direction(get_xy(-2), end),
+            )
+        return self._arc_ends
+
+
+    def get_projected_lengths(self, buffer, leak_index, arc_index, distance):
+        """ Length of every pipe inside the buffer of its leak from the projection of the leak along the pipe:
+            the chord of the buffer on each side of the projected point, clipped to the ends of the pipe.
+            No buffer polygon is built. Exact for straight pipes """
+
+        np = self.np
+        shapely = self.shapely
+        arc_length, start, start_direction, end, end_direction = self._get_arc_ends()
+        arc_length = arc_length[arc_index]
+        fraction = shapely.line_locate_point(
+            self.arc_geom[arc_index], self.leak_geom[leak_index], normalized=True
+        )
+        leak_xy = np.column_stack(
+            (shapely.get_x(self.leak_geom[leak_index]), shapely.get_y(self.leak_geom[leak_index]))
+        )
+        # Leaks projected beyond the ends of the pipe: distance along the extension of the first or last segment
+        before = np.minimum(0, ((leak_xy - start[arc_index]) * start_direction[arc_index]).sum(axis=1))
+        after = np.maximum(0, ((leak_xy - end[arc_index]) * end_direction[arc_index]).sum(axis=1))
+        overshoot = np.where(fraction <= 0, before, np.where(fraction >= 1, after, 0))
+
+        position = fraction * arc_length + overshoot
+        half_chord = np.sqrt(np.maximum(buffer**2 - distance**2 + overshoot**2, 0))
+        return np.minimum(arc_length, position + half_chord) - np.maximum(0, position - half_chord)
+
+
+    def get_lengths(self, buffer, leak_index, arc_index, distance, length_mode="intersection"):
+
+        if length_mode == "projection":
+            return self.get_projected_lengths(buffer, leak_index, arc_index, distance)
+        return self.get_buffer_lengths(buffer, leak_index, arc_index)
+
+
+    def get_candidates(self, buffer, years, length_mode="intersection"):
+        """ Same rows as the PostGIS candidate query of the assignation:
+            (leak_id, leak_diameter, leak_material, arc_id, arc_diameter, arc_material, distance, length) """
+
+        leak_index, arc_index, distance = self.get_candidate_pairs(buffer, self.get_period_mask(years))
+        length = self.get_lengths(buffer, leak_index, arc_index, distance, length_mode)
+        return self.to_rows(leak_index, arc_index, distance, length)
+
+
+    def to_rows(self, leak_index, arc_index, *columns):
+        """ Rows of (leak_id, leak_diameter, leak_material, arc_id, arc_diameter, arc_material, *@columns) """
+
+        columns = [column.tolist() if hasattr(column, "tolist") else column for column in columns]
+        return [
+            (
+                int(self.leak_id[i]),
+                self.leak_diameter[i],
+                self.leak_material[i],
+                int(self.arc_id[j]),
+                self.arc_diameter[j],
+                self.arc_material[j],
+                *values,
+            )
+            for i, j, *values in zip(leak_index.tolist(), arc_index.tolist(), *columns)
+        ]
+
+
+    def get_arc_lengths(self):
+        """ (arc_id, length) of every pipe, as ARC_LENGTHS_SQL of the assignation """
+        return self.arc_rows
@@ -0,0 +1,107 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import json
+
+from .leak_stats import MAX_DATE_SQL
+
+# Tables stored in spatial order, so the leak-pipe join of the assignation reads neighbour pages
+CLUSTER_TABLES = ("arc_asset", "leaks")
+# 'gist': order of the spatial index. 'hilbert': Hilbert curve, the order of the btree of geometries (PostGIS 3.1+)
+CLUSTER_METHODS = ("gist", "hilbert")
+
+
+class GwStorageMaintenanceEngine:
+    """ Rewrite arc_asset and leaks in spatial order (CLUSTER) and analyze them.
+        The candidate search of the assignation is timed before and after, with @buffer and @years """
+
+    def __init__(self, db, feedback, method="gist", buffer=500, years=5, tables=CLUSTER_TABLES):
+        if method not in CLUSTER_METHODS:
+            raise ValueError(f"Unknown cluster method: '{method}'")
+        self.db = db
+        self.feedback = feedback
+        self.method = method
+        self.buffer = buffer
+        self.years = years
+        self.tables = tables
+
+    def run(self):
+        try:
+            self.feedback.set_progress(0)
+            self.feedback.emit_report("Timing the leak-pipe search before clustering...")
+            with self.feedback.stage("Timing before"):
+                before = self._time_search()
+            self.feedback.set_progress(20)
+
+            for i, table in enumerate(self.tables):
+                if self.feedback.is_canceled():
+                    self.feedback.emit_report("Task canceled.")
+                    return False
+                self.feedback.emit_report(f"Clustering table '{table}' ({self.method})...")
+                with self.feedback.stage(f"Clustering {table}"):
+                    self._cluster(table)
+                self.feedback.set_progress(20 + 60 * (i + 1) / len(self.tables))
+
+            self.feedback.emit_report("Timing the leak-pipe search after clustering...")
+            with self.feedback.stage("Timing after"):
+                after = self._time_search()
+            self.feedback.set_progress(100)
+
+            self.feedback.emit_report(
+                "Task finished!",
+                f"Leak-pipe search (buffer {self.buffer}, {self.years} years), {before['rows']} pairs:",
+                f"  Before: {before['time']:.0f} ms, {before['pages']} pages ({before['read']} read from disk).",
+                f"  After: {after['time']:.0f} ms, {after['pages']} pages ({after['read']} read from disk).",
+            )
+            return True
+
+        except Exception as e:
+            self.feedback.emit_report(f"Error: {e}")
+            return False
+
+    def _cluster(self, table):
+
+        if self.method == "gist":
+            index = f"{table}_the_geom_idx"
+            sql = f"""
+                CREATE INDEX IF NOT EXISTS {index} ON asset.{table} USING gist (the_geom);
+                CLUSTER asset.{table} USING {index};
+                ANALYZE asset.{table};
+            """
+        else:
+            # The btree of geometries sorts them along a Hilbert curve. Only needed while clustering
+            index = f"{table}_the_geom_hilbert_idx"
+            sql = f"""
+                CREATE INDEX IF NOT EXISTS {index} ON asset.{table} USING btree (the_geom);
+                CLUSTER asset.{table} USING {index};
+                DROP INDEX asset.{index};
+                ANALYZE asset.{table};
+            """
+        self.db.execute_sql(sql)
+
+    def _time_search(self):
+        """ Execution time (ms), pages touched and pages read from disk by the candidate search """
+
+        row = self.db.get_row(
+            f"""
+            EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+            SELECT l.id, a.arc_id, ST_DISTANCE(l.the_geom, a.the_geom)
+            FROM asset.leaks AS l
+            JOIN asset.arc_asset AS a ON ST_DWITHIN(l.the_geom, a.the_geom, {self.buffer})
+            WHERE l.startdate > ({MAX_DATE_SQL} - INTERVAL '{self.years} year')::date
+            """
+        )
+        explain = row[0]
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+        plan = explain[0]
+        return {
+            "time": plan["Execution Time"],
+            "rows": plan["Plan"]["Actual Rows"],
+            "pages": plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0),
+            "read": plan["Plan"].get("Shared Read Blocks", 0),
+        }
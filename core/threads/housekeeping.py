@@ -0,0 +1,35 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .task import GwTask
+from ..engines.db import GwToolsDbAdapter
+from ..engines.housekeeping import GwHousekeepingEngine
+
+
+class GwResultHousekeeping(GwTask):
+    report = pyqtSignal(dict)
+
+    def __init__(self, description, result_ids, archive=None, archive_folder=None, vacuum_full=False):
+        super().__init__(description)
+        self.messages = []
+        self.engine = GwHousekeepingEngine(
+            GwToolsDbAdapter(),
+            self,
+            result_ids,
+            archive,
+            archive_folder,
+            vacuum_full,
+        )
+
+    def run(self):
+        return self.engine.run()
+
+    def emit_report(self, *args):
+        self.messages.extend(args)
+        self.report.emit({"info": {"values": [{"message": arg} for arg in args]}})
@@ -0,0 +1,39 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .task import GwTask
+from ..engines.db import GwToolsDbAdapter
+from ..engines.leak_import import GwLeakImportEngine
+from ..utils import lookup_cache
+
+
+class GwLeakImport(GwTask):
+    report = pyqtSignal(dict)
+
+    def __init__(self, description, path, layer=None, source_srid=None, update_existing=True):
+        super().__init__(description)
+        self.messages = []
+        self.engine = GwLeakImportEngine(
+            GwToolsDbAdapter(),
+            self,
+            path,
+            layer,
+            source_srid,
+            update_existing,
+        )
+
+    def run(self):
+        status = self.engine.run()
+        if status:
+            lookup_cache.invalidate()
+        return status
+
+    def emit_report(self, *args):
+        self.messages.extend(args)
+        self.report.emit({"info": {"values": [{"message": arg} for arg in args]}})
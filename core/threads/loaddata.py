@@ -0,0 +1,39 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .task import GwTask
+
+
+class GwLoadData(GwTask):
+    """ Read the data of a dialog in background, so the dialog can open at once.
+        Every value is emitted with signal 'loaded' as soon as it is read """
+
+    loaded = pyqtSignal(str, object)
+
+    def __init__(self, description, loaders):
+        """
+        :param loaders: list of (key, function) pairs. Functions are called in order, without arguments
+        """
+        super().__init__(description)
+        self.loaders = loaders
+        self.results = {}
+
+    def run(self):
+        super().run()
+        try:
+            for key, function in self.loaders:
+                if self.isCanceled():
+                    return False
+                value = function()
+                self.results[key] = value
+                self.loaded.emit(key, value)
+            return True
+        except Exception as e:
+            self.exception = e
+            return False
@@ -0,0 +1,28 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .task import GwTask
+from ..engines.db import GwToolsDbAdapter
+from ..engines.storage import GwStorageMaintenanceEngine
+
+
+class GwStorageMaintenance(GwTask):
+    report = pyqtSignal(dict)
+
+    def __init__(self, description, method="gist", buffer=500, years=5):
+        super().__init__(description)
+        self.messages = []
+        self.engine = GwStorageMaintenanceEngine(GwToolsDbAdapter(), self, method, buffer, years)
+
+    def run(self):
+        return self.engine.run()
+
+    def emit_report(self, *args):
+        self.messages.extend(args)
+        self.report.emit({"info": {"values": [{"message": arg} for arg in args]}})
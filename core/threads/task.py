@@ -10,7 +10,10 @@ from time import sleep
 from qgis.PyQt.QtCore import pyqtSignal, QObject
 from qgis.core import QgsTask
 
+from ... import global_vars
 from ...settings import tools_qgis, tools_qt, tools_gw, tools_db, dialog, toolbox, tools_os, tools_log
+from ..utils.config_parser import get_config
+from ..utils.task_stats import GwStageRecorder
 
 
 
@@ -25,6 +28,35 @@ class GwTask(QgsTask, QObject):
         super().__init__(description, QgsTask.CanCancel)
         self.exception = None
         self.duration = duration
+        self._init_stage_recorder(description)
+
+
+    def _init_stage_recorder(self, description):
+        """ Configure per-stage instrumentation from section 'task_stats' of config file """
+
+        config = get_config()
+        log_stats = config.getboolean("task_stats", "log_stats", fallback=True)
+        trace_memory = config.getboolean("task_stats", "trace_memory", fallback=False)
+        self.save_stats = config.getboolean("task_stats", "save_stats", fallback=False)
+        log_function = tools_log.log_info if log_stats else None
+        self.stage_recorder = GwStageRecorder(description, log_function, trace_memory)
+
+
+    def set_progress(self, value):
+        self.setProgress(value)
+
+
+    def is_canceled(self):
+        return self.isCanceled()
+
+
+    def stage(self, stage_name, rows_in=None):
+        """ Context manager that measures a step of the task. Usage:
+            with self.stage("Getting data", rows_in=n) as stats:
+                ...
+                stats.rows_out = len(rows)
+        """
+        return self.stage_recorder.stage(stage_name, rows_in)
 
 
     def run(self):
@@ -51,6 +83,9 @@ class GwTask(QgsTask, QObject):
 
     def finished(self, result):
 
+        if self.save_stats:
+            self._save_stage_stats()
+
         if result:
             tools_log.log_info(f"Task {self.description()} completed")
         else:
@@ -61,6 +96,17 @@ class GwTask(QgsTask, QObject):
                 raise self.exception
 
 
+    def _save_stage_stats(self):
+        """ Append recorded stages to table 'asset.log_task_stats' """
+
+        config = get_config('metadata.txt', global_vars.plugin_dir)
+        plugin_version = config.get('general', 'version', fallback=None)
+        try:
+            self.stage_recorder.save(tools_db, plugin_version)
+        except Exception as e:
+            tools_log.log_info(f"Task {self.description()} could not save stage stats: {e}")
+
+
     def cancel(self):
 
         tools_log.log_info(f"Task {self.description()} was cancelled")
@@ -5,7 +5,6 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
-import configparser
 import os
 
 from functools import partial
@@ -20,15 +19,13 @@ from qgis.PyQt.QtSql import QSqlTableModel, QSqlDatabase, QSqlQueryModel
 from ....settings import tools_qgis, tools_qt, tools_gw, dialog, tools_os, tools_log, tools_db, gw_global_vars
 from .... import global_vars
 
-from .priority import CalculatePriority
-from ...threads.assignation import GwAssignation
-from ...threads.calculatepriority import GwCalculatePriority
-from ...ui.ui_manager import AssignationUi, PriorityUi
+from ...ui import ui_manager
+from ...utils.config_parser import get_config
 
 
 class AmBreakage(dialog.GwAction):
     """ Button 1: Breakage button
-    Dropdown with two options: 'Incremental load' and 'Assigning' """
+    Dropdown with options: 'Incremental load', 'Assigning', 'Global priority' and 'Maintenance' """
 
     def __init__(self, icon_path, action_name, text, toolbar, action_group):
 
@@ -73,7 +70,12 @@ class AmBreakage(dialog.GwAction):
             del action
         ag = QActionGroup(self.iface.mainWindow())
 
-        actions = ['ASIGNACIÓN ROTURAS', 'CÁLCULO PRIORIDADES (GLOBAL)']
+        actions = [
+            'CARGA INCREMENTAL',
+            'ASIGNACIÓN ROTURAS',
+            'CÁLCULO PRIORIDADES (GLOBAL)',
+            'MANTENIMIENTO (ORDEN ESPACIAL)',
+        ]
         for action in actions:
             obj_action = QAction(f"{action}", ag)
             self.menu.addAction(obj_action)
@@ -82,22 +84,100 @@ class AmBreakage(dialog.GwAction):
     def _get_selected_action(self, name):
         """ Gets selected action """
 
-        if name == 'ASIGNACIÓN ROTURAS':
+        if name == 'CARGA INCREMENTAL':
+            self.incremental_load()
+        elif name == 'ASIGNACIÓN ROTURAS':
             self.assignation()
         elif name == 'CÁLCULO PRIORIDADES (GLOBAL)':
             self.priority_config()
+        elif name == 'MANTENIMIENTO (ORDEN ESPACIAL)':
+            self.storage_maintenance()
         else:
             msg = f"No action found"
             tools_qgis.show_warning(msg, parameter=name)
 
 
+    def incremental_load(self):
+        """ Load the leaks of a CSV or GeoPackage file into asset.leaks, in background """
+
+        folder = tools_gw.get_config_parser(
+            "incremental_load", "folder", "user", "session", plugin=global_vars.user_folder_name
+        )
+        path, _ = QFileDialog.getOpenFileName(
+            None, "Select leaks file", folder or "", "Leaks (*.csv *.gpkg);;CSV (*.csv);;GeoPackage (*.gpkg)"
+        )
+        if not path:
+            return
+        tools_gw.set_config_parser(
+            "incremental_load", "folder", os.path.dirname(path), plugin=global_vars.user_folder_name
+        )
+
+        # Get import parameters from config file
+        config = get_config()
+        csv_srid = config.getint("leak_import", "csv_srid", fallback=5367)
+        update_existing = config.getboolean("leak_import", "update_existing", fallback=True)
+        source_srid = None if path.lower().endswith(".gpkg") else csv_srid
+
+        text = f"Load the leaks of '{os.path.basename(path)}'?"
+        if update_existing:
+            text += "\nLeaks already loaded (same ext_code) will be updated."
+        if not tools_qt.show_question(text):
+            return
+
+        # Engine modules are only imported when a task starts
+        from ...threads.leak_import import GwLeakImport
+
+        self.thread_import = GwLeakImport("Leak import", path, None, source_srid, update_existing)
+        t = self.thread_import
+        t.taskCompleted.connect(partial(self._task_ended, t))
+        t.taskTerminated.connect(partial(self._task_ended, t))
+        QgsApplication.taskManager().addTask(t)
+
+    def _task_ended(self, task):
+        tools_qt.show_info_box("\n".join(task.messages))
+
+    def storage_maintenance(self):
+        """ Store pipes and leaks in spatial order, in background """
+
+        # The search is timed with the values of the last assignation
+        def get_user_value(widget, default):
+            value = tools_gw.get_config_parser(
+                "assignation", widget, "user", "session", plugin=global_vars.user_folder_name
+            )
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return default
+
+        buffer = get_user_value("txt_buffer", 500)
+        years = get_user_value("txt_years", 5)
+        method = get_config().get("storage_maintenance", "cluster_method", fallback="gist")
+
+        text = (
+            "Pipes and leaks will be rewritten in spatial order. "
+            "Both tables are locked while the task runs. Do you want to continue?"
+        )
+        if not tools_qt.show_question(text):
+            return
+
+        # Engine modules are only imported when a task starts
+        from ...threads.storage import GwStorageMaintenance
+
+        self.thread_storage = GwStorageMaintenance("Storage maintenance", method, buffer, years)
+        t = self.thread_storage
+        t.taskCompleted.connect(partial(self._task_ended, t))
+        t.taskTerminated.connect(partial(self._task_ended, t))
+        QgsApplication.taskManager().addTask(t)
+
     def priority_config(self):
+        from .priority import CalculatePriority
+
         calculate_priority = CalculatePriority(type="GLOBAL")
         calculate_priority.clicked_event()
 
     def assignation(self):
 
-        self.dlg_assignation = AssignationUi()
+        self.dlg_assignation = ui_manager.AssignationUi()
         dlg = self.dlg_assignation
         tools_gw.load_settings(dlg)
         dlg.executing = False
@@ -131,15 +211,12 @@ class AmBreakage(dialog.GwAction):
         status = True
         try:
 
-            # Read the config file
-            config = configparser.ConfigParser()
-            config_path = os.path.join(global_vars.plugin_dir, f"config{os.sep}config.config")
-            if not os.path.exists(config_path):
-                print(f"Config file not found: {config_path}")
+            # Get the config file
+            config = get_config()
+            if not config.exists():
+                print(f"Config file not found: {config.path}")
                 return
 
-            config.read(config_path)
-
             # Get configuration parameters
             if tools_os.set_boolean(config.get("dialog_leaks", "show_check_material")) is not True:
                 self.dlg_assignation.lbl_material.setVisible(False)
@@ -216,6 +293,9 @@ class AmBreakage(dialog.GwAction):
         ):
             return
 
+        # Engine modules are only imported when a task starts
+        from ...threads.assignation import GwAssignation
+
         self.thread = GwAssignation(
             "Leak Assignation",
             method,
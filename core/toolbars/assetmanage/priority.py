@@ -8,7 +8,6 @@ or (at your option) any later version.
 from datetime import datetime, timedelta
 from functools import partial
 from time import time
-import configparser
 import os
 import json
 
@@ -37,8 +36,11 @@ from ....settings import (
 )
 from .... import global_vars
 
-from ...threads.calculatepriority import GwCalculatePriority
-from ...ui.ui_manager import PriorityUi, PriorityManagerUi
+from ...threads.loaddata import GwLoadData
+from ...ui import ui_manager
+from ...utils import lookup_cache
+from ...utils.diameter_bands import GwDiameterBands
+from ...utils.config_parser import get_config
 
 
 def table2data(table_view):
@@ -86,9 +88,12 @@ class CalculatePriority:
 
         # Priority variables
         self.dlg_priority = None
+        self.lookups = {}
+        self.load_task = None
+        self.config_engine_fields = []
 
     def clicked_event(self):
-        self.dlg_priority = PriorityUi()
+        self.dlg_priority = ui_manager.PriorityUi()
         dlg = self.dlg_priority
         dlg.setWindowTitle(dlg.windowTitle() + f" ({self.type})")
 
@@ -109,9 +114,6 @@ class CalculatePriority:
         # Manage selection group
         self._manage_selection()
 
-        # Manage attributes group
-        self._manage_attr()
-
         # Define tableviews
         self.qtbl_diameter = self.dlg_priority.findChild(QTableView, "tbl_diameter")
         self.qtbl_diameter.setSelectionBehavior(QAbstractItemView.SelectRows)
@@ -145,14 +147,78 @@ class CalculatePriority:
             schema_name="asset",
         )
 
-        self._fill_engine_options()
         self._set_signals()
 
         self.dlg_priority.executing = False
 
+        # Lookups already read in this session fill the form at once.
+        # Otherwise the dialog opens with placeholders and they are read in background
+        lookups = lookup_cache.get_cached_lookups()
+        if lookups is not None:
+            self._fill_lookups("lookups", lookups)
+        else:
+            self._load_lookups()
+
         # Open the dialog
         tools_gw.open_dialog(self.dlg_priority, dlg_name="priority")
 
+    def _load_lookups(self):
+        dlg = self.dlg_priority
+        for combo in (
+            dlg.cmb_dnom,
+            dlg.cmb_material,
+            dlg.cmb_expl_selection,
+            dlg.cmb_presszone,
+        ):
+            combo.addItem("Loading...")
+            combo.setEnabled(False)
+        dlg.btn_calc.setEnabled(False)
+
+        self.load_task = GwLoadData(
+            "Loading priority data", [("lookups", lookup_cache.get_lookups)]
+        )
+        self.load_task.loaded.connect(self._fill_lookups)
+        self.load_task.taskCompleted.connect(partial(self._loading_ended, self.load_task))
+        self.load_task.taskTerminated.connect(partial(self._loading_failed, self.load_task))
+        dlg.finished.connect(partial(self._stop_loading, self.load_task))
+        QgsApplication.taskManager().addTask(self.load_task)
+
+    def _stop_loading(self, task, result=None):
+        """Stop filling the dialog once it is closed"""
+        if self.load_task is not task:
+            # Already finished: the task manager may have deleted it
+            return
+        self.load_task = None
+        try:
+            task.loaded.disconnect()
+            task.cancel()
+        except (RuntimeError, TypeError):
+            pass
+
+    def _loading_ended(self, task):
+        if self.load_task is task:
+            self.load_task = None
+
+    def _loading_failed(self, task):
+        if self.load_task is not task:
+            # Canceled when closing the dialog
+            return
+        self.load_task = None
+        self._fill_lookups("lookups", None)
+
+    def _fill_lookups(self, key, value):
+        if value is None:
+            tools_qgis.show_warning("Could not load the data of the priority dialog")
+
+        self.lookups = value or {}
+
+        # Manage attributes group
+        self._manage_null_filters()
+        self._manage_attr()
+
+        self._fill_engine_options()
+        self.dlg_priority.btn_calc.setEnabled(True)
+
     def _calculate_ended(self):
         dlg = self.dlg_priority
         dlg.btn_cancel.clicked.disconnect()
@@ -171,19 +237,7 @@ class CalculatePriority:
 
     def _fill_engine_options(self):
         self.config_engine_fields = []
-        rows = tools_db.get_rows(
-            """
-            select parameter,
-                value,
-                descript,
-                layoutname,
-                layoutorder,
-                label,
-                datatype,
-                widgettype
-            from asset.config_engine_def
-            """
-        )
+        rows = self.lookups.get("config_engine", [])
 
         for row in rows:
             self.config_engine_fields.append(
@@ -211,6 +265,9 @@ class CalculatePriority:
         tools_gw.add_widget(self.dlg_priority, position_config, lbl, lbl_total_weight)
         self._update_total_weight()
 
+        for widget in self._get_weight_widgets():
+            widget.textChanged.connect(self._update_total_weight)
+
     def _get_weight_widgets(self):
         is_weight = lambda x: x["layoutname"] == "lyt_weights"
         fields = filter(is_weight, self.config_engine_fields)
@@ -228,17 +285,12 @@ class CalculatePriority:
                     f"Type of priority dialog shoud be 'GLOBAL' or 'SELECTION'. Value passed: '{self.type}'."
                 )
 
-            # Read the config file
-            config = configparser.ConfigParser()
-            config_path = os.path.join(
-                global_vars.plugin_dir, f"config{os.sep}config.config"
-            )
-            if not os.path.exists(config_path):
-                print(f"Config file not found: {config_path}")
+            # Get the config file
+            config = get_config()
+            if not config.exists():
+                print(f"Config file not found: {config.path}")
                 return
 
-            config.read(config_path)
-
             # Get configuration parameters
             if config.getboolean(dialog_type, "show_budget") is not True:
                 self.dlg_priority.lbl_budget.setVisible(False)
@@ -257,20 +309,10 @@ class CalculatePriority:
                 if config.getboolean(dialog_type, "show_material") is not True:
                     self.dlg_priority.lbl_material.setVisible(False)
                     self.dlg_priority.cmb_material.setVisible(False)
-                # Hide Explotation filter if there's arcs without expl_id
-                if config.getboolean(
-                    dialog_type, "show_exploitation"
-                ) is not True or tools_db.get_row(
-                    "SELECT 1 FROM asset.arc_asset WHERE expl_id IS NULL"
-                ):
+                if config.getboolean(dialog_type, "show_exploitation") is not True:
                     self.dlg_priority.lbl_expl_selection.setVisible(False)
                     self.dlg_priority.cmb_expl_selection.setVisible(False)
-                # Hide Presszone filter if there's arcs without presszone_id
-                if config.getboolean(
-                    dialog_type, "show_presszone"
-                ) is not True or tools_db.get_row(
-                    "SELECT 1 FROM asset.arc_asset WHERE presszone_id IS NULL"
-                ):
+                if config.getboolean(dialog_type, "show_presszone") is not True:
                     self.dlg_priority.lbl_presszone.setVisible(False)
                     self.dlg_priority.cmb_presszone.setVisible(False)
             if config.getboolean(dialog_type, "show_ivi_button") is not True:
@@ -314,13 +356,12 @@ class CalculatePriority:
             config_engine,
         ) = inputs
 
+        diameter_bands = GwDiameterBands(config_diameter)
         invalid_diameters_count = tools_db.get_row(
             f"""
             select count(*)
             from asset.arc_asset
-            where dnom is null 
-                or dnom <= 0
-                or dnom > ({max(config_diameter.keys())})
+            where {diameter_bands.get_invalid_sql()}
             """
         )[0]
         if invalid_diameters_count:
@@ -330,9 +371,7 @@ class CalculatePriority:
                     f"""
                     select distinct dnom
                     from asset.arc_asset
-                    where dnom is null 
-                        or dnom <= 0
-                        or dnom > ({max(config_diameter.keys())})
+                    where {diameter_bands.get_invalid_sql()}
                     """
                 )
             ]
@@ -377,6 +416,9 @@ class CalculatePriority:
             if not tools_qt.show_question(text, force_action=True):
                 return
 
+        # Engine modules are only imported when a task starts
+        from ...threads.calculatepriority import GwCalculatePriority
+
         self.thread = GwCalculatePriority(
             "Calculate Priority",
             self.type,
@@ -392,6 +434,7 @@ class CalculatePriority:
             config_diameter=config_diameter,
             config_material=config_material,
             config_engine=config_engine,
+            diameter_bands=diameter_bands,
         )
         t = self.thread
         t.taskCompleted.connect(self._calculate_ended)
@@ -515,9 +558,6 @@ class CalculatePriority:
         dlg.btn_cancel.clicked.connect(partial(tools_gw.close_dialog, dlg))
         dlg.rejected.connect(partial(tools_gw.close_dialog, dlg))
 
-        for widget in self._get_weight_widgets():
-            widget.textChanged.connect(self._update_total_weight)
-
     def _update_timer(self, widget):
         elapsed_time = time() - self.t0
         text = str(timedelta(seconds=round(elapsed_time)))
@@ -630,36 +670,51 @@ class CalculatePriority:
 
     # region Attribute
 
+    def _manage_null_filters(self):
+
+        # Hide Explotation filter if there's arcs without expl_id
+        if self.lookups.get("null_expl_id"):
+            self.dlg_priority.lbl_expl_selection.setVisible(False)
+            self.dlg_priority.cmb_expl_selection.setVisible(False)
+        # Hide Presszone filter if there's arcs without presszone_id
+        if self.lookups.get("null_presszone_id"):
+            self.dlg_priority.lbl_presszone.setVisible(False)
+            self.dlg_priority.cmb_presszone.setVisible(False)
+
     def _manage_attr(self):
 
         # Combo dnom
-        sql = "SELECT distinct(dnom::float) as id, dnom as idval FROM cat_arc WHERE dnom is not null ORDER BY id;"
-        rows = tools_db.get_rows(sql)
+        rows = self.lookups.get("dnom", [])
         tools_qt.fill_combo_values(
             self.dlg_priority.cmb_dnom, rows, 1, sort_by=0, add_empty=True
         )
 
         # Combo material
-        sql = "SELECT id, id as idval FROM cat_mat_arc ORDER BY id;"
-        rows = tools_db.get_rows(sql)
+        rows = self.lookups.get("material", [])
         tools_qt.fill_combo_values(
             self.dlg_priority.cmb_material, rows, 1, add_empty=True
         )
 
         # Combo exploitation
-        sql = "SELECT expl_id as id, name as idval FROM asset.exploitation;"
-        rows = tools_db.get_rows(sql)
+        rows = self.lookups.get("exploitation", [])
         tools_qt.fill_combo_values(
             self.dlg_priority.cmb_expl_selection, rows, 1, add_empty=True
         )
 
         # Combo presszone
-        sql = "SELECT presszone_id as id, name as idval FROM asset.presszone"
-        rows = tools_db.get_rows(sql)
+        rows = self.lookups.get("presszone", [])
         tools_qt.fill_combo_values(
             self.dlg_priority.cmb_presszone, rows, 1, add_empty=True
         )
 
+        for combo in (
+            self.dlg_priority.cmb_dnom,
+            self.dlg_priority.cmb_material,
+            self.dlg_priority.cmb_expl_selection,
+            self.dlg_priority.cmb_presszone,
+        ):
+            combo.setEnabled(True)
+
     # endregion
 
     def _fill_table(
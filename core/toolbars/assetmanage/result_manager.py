@@ -5,13 +5,50 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+import os
+from functools import partial
+
+from qgis.core import QgsApplication
+from qgis.PyQt.QtCore import Qt
 from qgis.PyQt.QtWidgets import QMenu, QAction, QActionGroup, QTableView
-from qgis.PyQt.QtSql import QSqlTableModel, QSqlDatabase, QSqlQueryModel
+from qgis.PyQt.QtSql import QSqlTableModel, QSqlDatabase, QSqlDriver, QSqlQueryModel
 
 from ....settings import tools_qgis, tools_qt, tools_gw, dialog, tools_os, tools_log, tools_db, gw_global_vars
 from .... import global_vars
 
-from ...ui.ui_manager import PriorityUi, PriorityManagerUi
+from ...ui import ui_manager
+from ...utils.config_parser import get_config
+
+# Columns too heavy to be read whole, shown truncated and read-only
+HEAVY_COLUMNS = ("features",)
+HEAVY_COLUMNS_LENGTH = 80
+
+
+class GwResultTableModel(QSqlTableModel):
+    """ QSqlTableModel with the filter in the select statement and heavy columns truncated and read-only.
+        Rows are added as the view scrolls by the incremental fetch of QSqlTableModel itself """
+
+    def selectStatement(self):
+
+        statement = super().selectStatement()
+        if not statement:
+            return statement
+
+        # Truncate heavy columns in the column list only
+        columns, sep, rest = statement.partition(" FROM ")
+        driver = self.database().driver()
+        for column in HEAVY_COLUMNS:
+            field = driver.escapeIdentifier(column, QSqlDriver.FieldName)
+            columns = columns.replace(field, f"left({field}::text, {HEAVY_COLUMNS_LENGTH}) AS {field}")
+        return f"{columns}{sep}{rest}"
+
+
+    def flags(self, index):
+
+        flags = super().flags(index)
+        if self.record().fieldName(index.column()) in HEAVY_COLUMNS:
+            flags &= ~Qt.ItemIsEditable
+        return flags
 
 
 class ResultManager(dialog.GwAction):
@@ -35,7 +72,7 @@ class ResultManager(dialog.GwAction):
 
     def open_manager(self):
 
-        self.dlg_priority_manager = PriorityManagerUi()
+        self.dlg_priority_manager = ui_manager.PriorityManagerUi()
 
         # Fill table global
         filter = f"result_type = 'GLOBAL'"
@@ -49,10 +86,77 @@ class ResultManager(dialog.GwAction):
                          set_edit_triggers=QTableView.DoubleClicked, expr=filter)
         tools_gw.set_tablemodel_config(self.dlg_priority_manager, self.dlg_priority_manager.tbl_selection,
                                        "cat_result", schema_name='asset')
+        self._set_signals()
+
         # Open the dialog
         tools_gw.open_dialog(self.dlg_priority_manager, dlg_name='priority_manager')
 
 
+    def _set_signals(self):
+
+        dlg = self.dlg_priority_manager
+        dlg.btn_delete_global.clicked.connect(partial(self._delete_results, dlg.tbl_global))
+        dlg.btn_delete_selection.clicked.connect(partial(self._delete_results, dlg.tbl_selection))
+
+
+    def _delete_results(self, table):
+        """ Archive, delete and vacuum the results selected in @table, in background """
+
+        model = table.model()
+        rows = sorted({index.row() for index in table.selectionModel().selectedIndexes()})
+        if not rows:
+            tools_qt.show_info_box("Select at least one result to delete.")
+            return
+        result_ids = [model.record(row).value("result_id") for row in rows]
+
+        # Get housekeeping parameters from config file
+        config = get_config()
+        archive = config.get("result_housekeeping", "archive", fallback="file")
+        if archive in ("", "None"):
+            archive = None
+        archive_folder = config.get("result_housekeeping", "archive_folder", fallback="")
+        if not archive_folder:
+            archive_folder = os.path.join(global_vars.roaming_user_dir, global_vars.user_folder_name, "archive")
+        vacuum_full = config.getboolean("result_housekeeping", "vacuum_full", fallback=False)
+
+        if archive == "schema":
+            text_archive = "They will be archived to schema 'asset_archive' first."
+        elif archive == "file":
+            text_archive = f"They will be archived to folder '{archive_folder}' first."
+        else:
+            text_archive = "They will NOT be archived."
+        text = f"Delete {len(result_ids)} result(s) and all their data?\n{text_archive}"
+        if not tools_qt.show_question(text, force_action=True):
+            return
+
+        # Engine modules are only imported when a task starts
+        from ...threads.housekeeping import GwResultHousekeeping
+
+        self.thread = GwResultHousekeeping("Result housekeeping", result_ids, archive, archive_folder, vacuum_full)
+        t = self.thread
+        t.taskCompleted.connect(partial(self._housekeeping_ended, t))
+        t.taskTerminated.connect(partial(self._housekeeping_ended, t))
+
+        dlg = self.dlg_priority_manager
+        dlg.btn_delete_global.setEnabled(False)
+        dlg.btn_delete_selection.setEnabled(False)
+        QgsApplication.taskManager().addTask(t)
+
+
+    def _housekeeping_ended(self, task):
+
+        # Comparisons of deleted results are not valid anymore
+        from ...engines import compare
+        compare.invalidate(task.engine.result_ids)
+
+        dlg = self.dlg_priority_manager
+        dlg.btn_delete_global.setEnabled(True)
+        dlg.btn_delete_selection.setEnabled(True)
+        dlg.tbl_global.model().select()
+        dlg.tbl_selection.model().select()
+        tools_qt.show_info_box("\n".join(task.messages))
+
+
     def _fill_table(self, dialog, widget, table_name, hidde=False, set_edit_triggers=QTableView.NoEditTriggers, expr=None):
         """ Set a model with selected filter.
             Attach that model to selected table
@@ -63,11 +167,13 @@ class ResultManager(dialog.GwAction):
         """
         try:
 
-            # Set model
-            model = QSqlTableModel(db=gw_global_vars.qgis_db_credentials)
+            # Set model, filtered before select so only matching rows are read
+            model = GwResultTableModel(db=gw_global_vars.qgis_db_credentials)
             model.setTable(table_name)
             model.setEditStrategy(QSqlTableModel.OnFieldChange)
             model.setSort(0, 0)
+            if expr:
+                model.setFilter(expr)
             model.select()
 
             # When change some field we need to refresh Qtableview and filter by psector_id
@@ -79,11 +185,7 @@ class ResultManager(dialog.GwAction):
                 print(f"ERROR -> {model.lastError().text()}")
 
             # Attach model to table view
-            if expr:
-                widget.setModel(model)
-                widget.model().setFilter(expr)
-            else:
-                widget.setModel(model)
+            widget.setModel(model)
 
             if hidde:
                 self.refresh_table(dialog, widget)
@@ -5,12 +5,16 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+from functools import partial
+
+from qgis.core import QgsApplication
 from qgis.PyQt.QtWidgets import QMenu, QAction, QActionGroup, QTableView
 
 from ....settings import tools_qt, tools_gw, dialog, tools_db, tools_qgis
 from .... import global_vars
 
-from ...ui.ui_manager import ResultSelectorUi
+from ...threads.loaddata import GwLoadData
+from ...ui import ui_manager
 
 
 class ResultSelector(dialog.GwAction):
@@ -24,57 +28,124 @@ class ResultSelector(dialog.GwAction):
         self.text = text
         self.toolbar = toolbar
         self.action_group = action_group
+        self.load_task = None
+        self.compare_task = None
 
     def clicked_event(self):
-        self.dlg_result_selector = ResultSelectorUi()
-        if not self._fill_combos():
-            return
-        self._update_descriptions()
+        self.dlg_result_selector = ui_manager.ResultSelectorUi()
+        dlg = self.dlg_result_selector
+
+        # Open the dialog at once, with placeholders until its data is loaded
+        for combo in (dlg.cmb_result_main, dlg.cmb_result_compare):
+            combo.addItem("Loading...")
+            combo.setEnabled(False)
+        dlg.btn_accept.setEnabled(False)
+
         self._set_signals()
-        tools_gw.open_dialog(self.dlg_result_selector, dlg_name="result_selection")
+        tools_gw.open_dialog(dlg, dlg_name="result_selection")
+        self._load_data()
 
-    def _fill_combos(self):
+    def _load_data(self):
         # TODO: Check for connection
+        loaders = [
+            (
+                "results",
+                partial(
+                    tools_db.get_rows,
+                    """
+                    select result_id id, result_name idval, descript
+                    from asset.cat_result
+                    """,
+                ),
+            ),
+            (
+                "selected_main",
+                partial(
+                    tools_db.get_row,
+                    """
+                    select result_id
+                    from asset.selector_result_main
+                    where cur_user = current_user
+                    """,
+                ),
+            ),
+            (
+                "selected_compare",
+                partial(
+                    tools_db.get_row,
+                    """
+                    select result_id
+                    from asset.selector_result_compare
+                    where cur_user = current_user
+                    """,
+                ),
+            ),
+        ]
+        self.load_task = GwLoadData("Loading results", loaders)
+        self.load_task.loaded.connect(self._fill_combos)
+        self.load_task.taskCompleted.connect(partial(self._forget_task, self.load_task))
+        self.load_task.taskTerminated.connect(partial(self._loading_failed, self.load_task))
+        self.dlg_result_selector.finished.connect(partial(self._stop_loading, self.load_task))
+        QgsApplication.taskManager().addTask(self.load_task)
+
+    def _stop_loading(self, task, result=None):
+        """ Stop filling the dialog once it is closed """
+        if not self._forget_task(task):
+            # Already finished: the task manager may have deleted it
+            return
+        try:
+            task.loaded.disconnect()
+            task.cancel()
+        except (RuntimeError, TypeError):
+            pass
+
+    def _forget_task(self, task):
+        """ Return True if @task was still running """
+        if self.load_task is task:
+            self.load_task = None
+            return True
+        if self.compare_task is task:
+            self.compare_task = None
+            return True
+        return False
+
+    def _loading_failed(self, task):
+        if not self._forget_task(task):
+            # Canceled when closing the dialog
+            return
         dlg = self.dlg_result_selector
-        results = tools_db.get_rows(
-            """
-            select result_id id, result_name idval, descript
-            from asset.cat_result
-            """
-        )
-        if not results:
-            tools_qt.show_info_box("No results available to display.")
-            return False
+        for combo in (dlg.cmb_result_main, dlg.cmb_result_compare):
+            combo.clear()
+            combo.setEnabled(True)
+        tools_qgis.show_warning("Could not load the results")
 
-        # Combo result_main
-        tools_qt.fill_combo_values(dlg.cmb_result_main, results, 1, sort_by=1)
-        selected_main = tools_db.get_row(
-            """
-            select result_id
-            from asset.selector_result_main
-            where cur_user = current_user
-            """
-        )
-        if selected_main:
+    def _fill_combos(self, key, value):
+        dlg = self.dlg_result_selector
+
+        if key == "results":
+            if not value:
+                dlg.close()
+                tools_qt.show_info_box("No results available to display.")
+                return
+
+            # Combo result_main and result_compare
+            tools_qt.fill_combo_values(dlg.cmb_result_main, value, 1, sort_by=1)
+            tools_qt.fill_combo_values(dlg.cmb_result_compare, value, 1, sort_by=1)
+            dlg.cmb_result_main.setEnabled(True)
+            dlg.cmb_result_compare.setEnabled(True)
+            dlg.btn_accept.setEnabled(True)
+
+        elif key == "selected_main" and value:
             tools_qt.set_combo_value(
-                dlg.cmb_result_main, str(selected_main[0]), 0, add_new=False
+                dlg.cmb_result_main, str(value[0]), 0, add_new=False
             )
 
-        # Combo result_compare
-        tools_qt.fill_combo_values(dlg.cmb_result_compare, results, 1, sort_by=1)
-        selected_compare = tools_db.get_row(
-            """
-            select result_id
-            from asset.selector_result_compare
-            where cur_user = current_user
-            """
-        )
-        if selected_compare:
+        elif key == "selected_compare" and value:
             tools_qt.set_combo_value(
-                dlg.cmb_result_compare, str(selected_compare[0]), 0, add_new=False
+                dlg.cmb_result_compare, str(value[0]), 0, add_new=False
             )
 
-        return True
+        self._update_descriptions()
 
     def _save_selection(self):
         # TODO: Check for connection
@@ -93,6 +164,7 @@ class ResultSelector(dialog.GwAction):
             insert into asset.selector_result_compare
                 (result_id, cur_user)
                 values ({result_compare}, current_user);
+            select asset.gw_fct_refresh_arc_output_selected();
             """
         )
         dlg.close()
@@ -105,6 +177,7 @@ class ResultSelector(dialog.GwAction):
         dlg.btn_accept.clicked.connect(self._save_selection)
         dlg.cmb_result_main.currentIndexChanged.connect(self._update_descriptions)
         dlg.cmb_result_compare.currentIndexChanged.connect(self._update_descriptions)
+        dlg.btn_compare.clicked.connect(self._compare_results)
 
     def _update_descriptions(self):
         dlg = self.dlg_result_selector
@@ -112,3 +185,64 @@ class ResultSelector(dialog.GwAction):
         dlg.txt_result_main_desc.setText(desc_main)
         desc_compare = tools_qt.get_combo_value(dlg, dlg.cmb_result_compare, 2)
         dlg.txt_result_compare_desc.setText(desc_compare)
+        self._show_comparison()
+
+    def _get_selected_results(self):
+        dlg = self.dlg_result_selector
+        result_main = tools_qt.get_combo_value(dlg, dlg.cmb_result_main)
+        result_compare = tools_qt.get_combo_value(dlg, dlg.cmb_result_compare)
+        if result_main in (None, "") or result_compare in (None, ""):
+            return None
+        return result_main, result_compare
+
+    def _show_comparison(self):
+        """Show the comparison of the selected results if it was already computed"""
+        from ...engines import compare
+
+        dlg = self.dlg_result_selector
+        results = self._get_selected_results()
+        comparison = compare.get_cached_comparison(*results) if results else None
+        dlg.txt_comparison.setText(
+            compare.comparison_to_text(comparison) if comparison else ""
+        )
+
+    def _compare_results(self):
+        from ...engines import compare
+        from ...engines.db import GwToolsDbAdapter
+
+        results = self._get_selected_results()
+        if not results:
+            return
+        if compare.get_cached_comparison(*results):
+            self._show_comparison()
+            return
+
+        dlg = self.dlg_result_selector
+        dlg.txt_comparison.setText("Comparing results...")
+        dlg.btn_compare.setEnabled(False)
+        task = GwLoadData(
+            "Comparing results",
+            [("comparison", partial(compare.get_comparison, GwToolsDbAdapter(), *results))],
+        )
+        task.loaded.connect(self._comparison_loaded)
+        task.taskCompleted.connect(partial(self._comparison_ended, task))
+        task.taskTerminated.connect(partial(self._comparison_failed, task))
+        dlg.finished.connect(partial(self._stop_loading, task))
+        self.compare_task = task
+        QgsApplication.taskManager().addTask(task)
+
+    def _comparison_loaded(self, key, value):
+        self._show_comparison()
+
+    def _comparison_ended(self, task):
+        if self._forget_task(task):
+            self.dlg_result_selector.btn_compare.setEnabled(True)
+
+    def _comparison_failed(self, task):
+        if not self._forget_task(task):
+            # Canceled when closing the dialog
+            return
+        dlg = self.dlg_result_selector
+        dlg.txt_comparison.setText("")
+        dlg.btn_compare.setEnabled(True)
+        tools_qgis.show_warning(f"Could not compare the results: {task.exception}")
@@ -5,10 +5,29 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+import importlib
 
-# assetmanage
-from .assetmanage.breakage import AmBreakage
-from .assetmanage.priority import AmPriority
-from .assetmanage.result_manager import ResultManager
-from .assetmanage.result_selector import ResultSelector
+# Button classes are imported on first access (see __getattr__), so their modules, dialogs and engines
+# are only loaded when 'manage_toolbars' instantiates them on an asset management project
+_BUTTON_MODULES = {
+    # assetmanage
+    'AmBreakage': '.assetmanage.breakage',
+    'AmPriority': '.assetmanage.priority',
+    'ResultManager': '.assetmanage.result_manager',
+    'ResultSelector': '.assetmanage.result_selector',
+}
 
+
+def __getattr__(name):
+
+    module_name = _BUTTON_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    button_class = getattr(importlib.import_module(module_name, __package__), name)
+    globals()[name] = button_class
+    return button_class
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_BUTTON_MODULES))
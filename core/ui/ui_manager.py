@@ -13,6 +13,9 @@ from qgis.PyQt import uic, QtCore
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QMainWindow, QDialog, QDockWidget, QWhatsThis, QLineEdit
 
+# Form classes generated from UI files: {(ui file, subfolder): form class}
+_ui_classes = {}
+
 
 class GwDialog(QDialog):
 
@@ -53,8 +56,22 @@ class GwDialog(QDialog):
 
 
 
+class GwExecutingDialog(GwDialog):
+    """ Dialog that can not be closed while its task is executing """
+
+    def closeEvent(self, event):
+        if self.executing:
+            event.ignore()
+        else:
+            event.accept()
+
+
 def get_ui_class(ui_file_name, subfolder='shared'):
-    """ Get UI Python class from @ui_file_name """
+    """ Get UI Python class from @ui_file_name. It is generated on first use and memoized for the session """
+
+    key = (ui_file_name, subfolder)
+    if key in _ui_classes:
+        return _ui_classes[key]
 
     # Folder that contains UI files
     if subfolder in ('basic', 'edit', 'epa', 'om', 'plan', 'utilities', 'toc', 'custom', 'assetmanage'):
@@ -62,32 +79,26 @@ def get_ui_class(ui_file_name, subfolder='shared'):
     else:
         ui_folder_path = os.path.dirname(__file__) + os.sep + subfolder
     ui_file_path = os.path.abspath(os.path.join(ui_folder_path, ui_file_name))
-    return uic.loadUiType(ui_file_path)[0]
+    _ui_classes[key] = uic.loadUiType(ui_file_path)[0]
+    return _ui_classes[key]
 
 
-# giswater_advancedtools
+# Dialog classes are built on first access (see __getattr__): {class name: (ui file, subfolder, base class)}
+_dialogs = {
+    # giswater_advancedtools
+    'AssignationUi': ('assignation.ui', 'assetmanage', GwExecutingDialog),
+    'PriorityUi': ('priority.ui', 'assetmanage', GwExecutingDialog),
+    'PriorityManagerUi': ('priority_manager.ui', 'assetmanage', GwDialog),
+    'ResultSelectorUi': ('result_selector.ui', 'assetmanage', GwDialog),
+}
 
 
-FORM_CLASS = get_ui_class('assignation.ui', 'assetmanage')
-class AssignationUi(GwDialog, FORM_CLASS):
-    def closeEvent(self, event):
-        if self.executing:
-            event.ignore()
-        else:
-            event.accept()
-
-FORM_CLASS = get_ui_class('priority.ui', 'assetmanage')
-class PriorityUi(GwDialog, FORM_CLASS):
-    def closeEvent(self, event):
-        if self.executing:
-            event.ignore()
-        else:
-            event.accept()
+def __getattr__(name):
 
-FORM_CLASS = get_ui_class('priority_manager.ui', 'assetmanage')
-class PriorityManagerUi(GwDialog, FORM_CLASS):
-    pass
+    if name not in _dialogs:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-FORM_CLASS = get_ui_class('result_selector.ui', 'assetmanage')
-class ResultSelectorUi(GwDialog, FORM_CLASS):
-    pass
\ No newline at end of file
+    ui_file_name, subfolder, base_class = _dialogs[name]
+    dialog_class = type(name, (base_class, get_ui_class(ui_file_name, subfolder)), {'__module__': __name__})
+    globals()[name] = dialog_class
+    return dialog_class
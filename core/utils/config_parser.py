@@ -5,8 +5,115 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 
+import configparser
 import os.path
-from ... import global_vars
+import threading
+
+# Folder 'config' of the plugin
+CONFIG_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config")
+
+_UNSET = object()
+_configs = {}
+_variable_indexes = {}
+_configs_lock = threading.Lock()
+
+
+class GwConfig:
+    """ Parsed config file shared by the whole session.
+        The file is parsed once and only parsed again when its modification time changes """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._parser = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+
+    def get_parser(self):
+        """ Return the up-to-date ConfigParser of the file (empty if the file does not exist) """
+
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+
+        with self._lock:
+            if self._parser is None or mtime != self._mtime:
+                parser = configparser.ConfigParser()
+                if mtime is not None:
+                    parser.read(self.path)
+                self._parser = parser
+                self._mtime = mtime
+            return self._parser
+
+
+    def get(self, section, option, fallback=_UNSET):
+
+        if fallback is _UNSET:
+            return self.get_parser().get(section, option)
+        return self.get_parser().get(section, option, fallback=fallback)
+
+
+    def getboolean(self, section, option, fallback=_UNSET):
+
+        if fallback is _UNSET:
+            return self.get_parser().getboolean(section, option)
+        return self.get_parser().getboolean(section, option, fallback=fallback)
+
+
+    def getint(self, section, option, fallback=_UNSET):
+
+        if fallback is _UNSET:
+            return self.get_parser().getint(section, option)
+        return self.get_parser().getint(section, option, fallback=fallback)
+
+
+    def getfloat(self, section, option, fallback=_UNSET):
+
+        if fallback is _UNSET:
+            return self.get_parser().getfloat(section, option)
+        return self.get_parser().getfloat(section, option, fallback=fallback)
+
+
+def get_config(file_name="config.config", folder=None):
+    """ Return the session-wide GwConfig of @file_name, inside @folder (default: plugin folder 'config') """
+
+    path = os.path.join(folder or CONFIG_FOLDER, file_name)
+    with _configs_lock:
+        config = _configs.get(path)
+        if config is None:
+            config = GwConfig(path)
+            _configs[path] = config
+    return config
+
+
+def _get_variable_index(file_path):
+    """ Return the {variable: value} index of @file_path, built again only when the file changes """
+
+    mtime = os.path.getmtime(file_path)
+    with _configs_lock:
+        cached = _variable_indexes.get(file_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    index = {}
+    with open(file_path, mode="r") as config_file:
+        for config_line in config_file:
+            # Ignore commented lines and lines without a 'name: value' pair
+            if config_line.startswith("#") or ":" not in config_line:
+                continue
+            var_name, value = config_line.split(":")[:2]
+            # Keep the first definition of a variable, as the file is read from top to bottom
+            index.setdefault(var_name.strip(), value.strip())
+
+    with _configs_lock:
+        _variable_indexes[file_path] = (mtime, index)
+    return index
 
 
 def parse_variable(file_name:str, var_name: str, default_value=None):
@@ -18,26 +125,9 @@ def parse_variable(file_name:str, var_name: str, default_value=None):
     :return: The found config variable's value. If no config variable was found, returns default_value.
     """
 
-    file_path = os.path.join(global_vars.plugin_dir, f"config{os.sep}{file_name}")
-    config_file = open(file_path, mode="r")
-
-    while True:
-        config_line = config_file.readline()
-
-        # If config line starts with a # character, ignore the entire line and continue checking.
-        if config_line.startswith("#"):
-            continue
-
-        # If config line starts with the desired variable name, return the value it holds.
-        if config_line.startswith(var_name):
-            config_line = config_line.split(":")[1]
-            config_line = config_line.strip()
-            return config_line
-
-        # If the file has been entirely read and no matching config variable name was found,
-        # display a warning and return the default value, if specified.
-        if not config_line:
-            print(f"Could not find a configuration variable with name «{var_name}». Using default value.")
-            return default_value
-
-    config_file.close()
\ No newline at end of file
+    file_path = os.path.join(CONFIG_FOLDER, file_name)
+    index = _get_variable_index(file_path)
+    if var_name not in index:
+        print(f"Could not find a configuration variable with name «{var_name}». Using default value.")
+        return default_value
+    return index[var_name]
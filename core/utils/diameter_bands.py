@@ -0,0 +1,49 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+from bisect import bisect_right
+
+
+class GwDiameterBands:
+    """ Reference diameters of a diameter configuration (keys of config_diameter).
+        A pipe takes the values of the smallest reference diameter greater than its own, or of the largest one
+        if its diameter is the largest. Built once by the priority dialog and shared with the engine:
+        lookups use bisect and are cached by diameter """
+
+    def __init__(self, diameters):
+
+        self.boundaries = sorted(diameters)
+        self.max_diameter = self.boundaries[-1] if self.boundaries else None
+        self._references = {}
+
+
+    def is_valid(self, diameter):
+        """ Pipes with NULL, zero, negative or too big diameters get no priority """
+
+        return diameter is not None and 0 < diameter <= self.max_diameter
+
+
+    def get_reference(self, diameter):
+        """ Smallest reference diameter greater than @diameter, the largest one for the largest diameter.
+            None if @diameter is not valid """
+
+        try:
+            return self._references[diameter]
+        except KeyError:
+            index = bisect_right(self.boundaries, diameter)
+            if index < len(self.boundaries):
+                reference = self.boundaries[index]
+            else:
+                reference = self.max_diameter if self.is_valid(diameter) else None
+            self._references[diameter] = reference
+            return reference
+
+
+    def get_invalid_sql(self, column="dnom"):
+        """ SQL condition of the invalid diameters in @column """
+
+        return f"{column} is null or {column} <= 0 or {column} > {self.max_diameter}"
@@ -0,0 +1,76 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import json
+import threading
+
+from ...settings import tools_db
+
+# Every lookup of the priority dialog in a single round trip
+LOOKUPS_SQL = """
+    SELECT json_build_object(
+        'dnom', (
+            SELECT json_agg(json_build_array(id, idval) ORDER BY id)
+            FROM (SELECT DISTINCT dnom::float AS id, dnom AS idval FROM cat_arc WHERE dnom IS NOT NULL) d
+        ),
+        'material', (SELECT json_agg(json_build_array(id, id) ORDER BY id) FROM cat_mat_arc),
+        'exploitation', (SELECT json_agg(json_build_array(expl_id, name)) FROM asset.exploitation),
+        'presszone', (SELECT json_agg(json_build_array(presszone_id, name)) FROM asset.presszone),
+        'config_engine', (
+            SELECT json_agg(json_build_array(
+                parameter, value, descript, layoutname, layoutorder, label, datatype, widgettype
+            ))
+            FROM asset.config_engine_def
+        ),
+        'null_expl_id', EXISTS (SELECT 1 FROM asset.arc_asset WHERE expl_id IS NULL),
+        'null_presszone_id', EXISTS (SELECT 1 FROM asset.arc_asset WHERE presszone_id IS NULL)
+    )
+"""
+
+_lookups = None
+_lock = threading.Lock()
+
+
+def get_lookups(reload=False):
+    """ Return the lookup data of the priority dialog.
+        It is read from the database the first time only, until the cache is invalidated """
+
+    global _lookups
+
+    with _lock:
+        if _lookups is not None and not reload:
+            return _lookups
+
+    row = tools_db.get_row(LOOKUPS_SQL)
+    if not row or row[0] is None:
+        return None
+
+    lookups = row[0]
+    if isinstance(lookups, str):
+        lookups = json.loads(lookups)
+    for key in ("dnom", "material", "exploitation", "presszone", "config_engine"):
+        lookups[key] = lookups.get(key) or []
+
+    with _lock:
+        _lookups = lookups
+    return lookups
+
+
+def get_cached_lookups():
+    """ Return the lookup data if already read, without querying the database """
+
+    with _lock:
+        return _lookups
+
+
+def invalidate():
+    """ Forget the lookup data, so the next dialog reads it again (e.g. when another project is opened or a task changed the pipes) """
+
+    global _lookups
+
+    with _lock:
+        _lookups = None
@@ -0,0 +1,105 @@
+"""
+This file is part of Giswater 3
+The program is free software: you can redistribute it and/or modify it under the terms of the GNU
+General Public License as published by the Free Software Foundation, either version 3 of the License,
+or (at your option) any later version.
+"""
+# -*- coding: utf-8 -*-
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class GwStageStats:
+    """ Measures taken for a single stage of a task """
+
+    __slots__ = ('task_name', 'stage_name', 'rows_in', 'rows_out', 'wall_time', 'cpu_time', 'peak_memory')
+
+    def __init__(self, task_name, stage_name, rows_in=None):
+
+        self.task_name = task_name
+        self.stage_name = stage_name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_time = None
+        self.cpu_time = None
+        self.peak_memory = None
+
+
+    def as_message(self):
+        """ Return a one-line human readable summary of the stage """
+
+        message = f"Task {self.task_name} - stage '{self.stage_name}': wall {self.wall_time:.3f}s, cpu {self.cpu_time:.3f}s"
+        if self.rows_in is not None:
+            message += f", rows in {self.rows_in}"
+        if self.rows_out is not None:
+            message += f", rows out {self.rows_out}"
+        if self.peak_memory is not None:
+            message += f", peak memory {self.peak_memory / 1024 / 1024:.1f} MiB"
+        return message
+
+
+class GwStageRecorder:
+    """ Record wall time, CPU time, row counts and peak memory of the stages of a task """
+
+    def __init__(self, task_name, log_function=None, trace_memory=False):
+        """
+        :param log_function: Callable receiving the summary message of every finished stage
+        :param trace_memory: Measure peak Python memory of every stage through tracemalloc (slower)
+        """
+
+        self.task_name = task_name
+        self.log_function = log_function
+        self.trace_memory = trace_memory
+        self.stages = []
+
+
+    @contextmanager
+    def stage(self, stage_name, rows_in=None):
+        """ Context manager measuring the enclosed block. Set 'rows_out' on the yielded stats if known """
+
+        stats = GwStageStats(self.task_name, stage_name, rows_in)
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield stats
+        finally:
+            stats.wall_time = time.perf_counter() - wall_start
+            stats.cpu_time = time.process_time() - cpu_start
+            if self.trace_memory and tracemalloc.is_tracing():
+                stats.peak_memory = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(stats)
+            if self.log_function:
+                self.log_function(stats.as_message())
+
+
+    def save(self, db, plugin_version=None):
+        """ Append recorded stages to table 'asset.log_task_stats' using @db (any object with 'execute_sql') """
+
+        if not self.stages:
+            return True
+
+        def _value(value):
+            return 'NULL' if value is None else value
+
+        str_version = f"'{plugin_version}'" if plugin_version else 'NULL'
+        sql = ("INSERT INTO asset.log_task_stats (task_name, stage_name, plugin_version, wall_time, cpu_time, "
+               "rows_in, rows_out, peak_memory) VALUES ")
+        values = []
+        for stats in self.stages:
+            task_name = stats.task_name.replace("'", "''")
+            stage_name = stats.stage_name.replace("'", "''")
+            values.append(f"('{task_name}', '{stage_name}', {str_version}, {stats.wall_time}, {stats.cpu_time}, "
+                          f"{_value(stats.rows_in)}, {_value(stats.rows_out)}, {_value(stats.peak_memory)})")
+        sql += ", ".join(values) + ";"
+        return db.execute_sql(sql)
@@ -1,6 +1,7 @@
 
 SET search_path = SCHEMA_NAME, public;
 
+-- One row per pipe, written by the assignation and the length trigger with ON CONFLICT (arc_id)
 CREATE TABLE arc_input
 (arc_id integer,
 result_id integer,
@@ -30,7 +31,7 @@ social boolean,
 other boolean,
 mandatory boolean,
 compliance boolean,
- CONSTRAINT arc_input_pkey PRIMARY KEY (arc_id, result_id));
+ CONSTRAINT arc_input_pkey PRIMARY KEY (arc_id));
 
 
 
@@ -79,7 +80,11 @@ year_order integer,
 strategic integer,
 compliance integer,
 val integer,
- CONSTRAINT arc_engine_sh_pkey PRIMARY KEY (arc_id, result_id));
+ CONSTRAINT arc_engine_sh_pkey PRIMARY KEY (arc_id, result_id))
+ PARTITION BY LIST (result_id);
+
+-- Rows of results without their own partition
+CREATE TABLE arc_engine_sh_default PARTITION OF arc_engine_sh DEFAULT;
 
 
 
@@ -90,9 +95,43 @@ val integer,
 mandatory boolean,
 orderby integer,
 target_year integer,
+expected_year integer,
 budget numeric (12,2),
 total numeric (12,2),
- CONSTRAINT arc_output_pkey PRIMARY KEY (arc_id, result_id));
+length numeric (12,3),
+cum_length numeric (12,3),
+ CONSTRAINT arc_output_pkey PRIMARY KEY (arc_id, result_id))
+ PARTITION BY LIST (result_id);
+
+-- Rows of results without their own partition
+CREATE TABLE arc_output_default PARTITION OF arc_output DEFAULT;
+
+
+-- Output of the results selected by every user (main and compare), read by the output layers
+CREATE TABLE arc_output_selected
+(cur_user text NOT NULL DEFAULT "current_user"(),
+selector character varying(10) NOT NULL,
+arc_id integer NOT NULL,
+result_id integer,
+sector_id integer,
+macrosector_id integer,
+presszone_id character varying(30),
+expl_id integer,
+builtdate date,
+dnom integer,
+matcat_id character varying(30),
+pavcat_id character varying(30),
+function_type character varying(50),
+rleak numeric(12,3),
+val integer,
+orderby integer,
+expected_year integer,
+budget numeric (12,2),
+total numeric (12,2),
+the_geom geometry(Linestring,5367),
+ CONSTRAINT arc_output_selected_pkey PRIMARY KEY (cur_user, selector, arc_id));
+
+CREATE INDEX arc_output_selected_the_geom_idx ON arc_output_selected USING gist (the_geom);
 
 
 CREATE TABLE config_diameter 
@@ -130,6 +169,43 @@ status smallint,
 
 
 
+-- Every result gets its own partition of arc_engine_sh and arc_output. The engines create and drop them in statements
+-- of their own, not from a trigger, so the strong lock they take on the parent tables is held only for that moment
+CREATE OR REPLACE FUNCTION gw_fct_create_result_partitions(p_result_id integer)
+  RETURNS void AS
+$BODY$
+BEGIN
+
+	EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF arc_engine_sh FOR VALUES IN (%s)',
+		'arc_engine_sh_' || p_result_id, p_result_id);
+	EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF arc_output FOR VALUES IN (%s)',
+		'arc_output_' || p_result_id, p_result_id);
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
+
+-- Before deleting the results, so the cascading FKs find their rows already gone with the partitions
+CREATE OR REPLACE FUNCTION gw_fct_drop_result_partitions(p_result_ids integer[])
+  RETURNS void AS
+$BODY$
+DECLARE
+	v_result_id integer;
+BEGIN
+
+	FOREACH v_result_id IN ARRAY p_result_ids LOOP
+		EXECUTE format('DROP TABLE IF EXISTS %I', 'arc_engine_sh_' || v_result_id);
+		EXECUTE format('DROP TABLE IF EXISTS %I', 'arc_output_' || v_result_id);
+	END LOOP;
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
+
 CREATE TABLE config_engine 
 (parameter character varying(50) NOT NULL,
 value text,
@@ -192,6 +268,21 @@ strategic integer,
  CONSTRAINT log_config_pkey PRIMARY KEY (result_id));
 
 
+CREATE TABLE log_task_stats
+(id serial,
+task_name text,
+stage_name text,
+plugin_version character varying(30),
+wall_time numeric(12,3),
+cpu_time numeric(12,3),
+rows_in integer,
+rows_out integer,
+peak_memory bigint,
+cur_user text DEFAULT "current_user"(),
+tstamp timestamp DEFAULT now(),
+ CONSTRAINT log_task_stats_pkey PRIMARY KEY (id));
+
+
 CREATE TABLE leaks
 (id serial, 
 ext_code text, 
@@ -209,13 +300,118 @@ days integer,
 the_geom geometry(Point,5367),
  CONSTRAINT leaks_pkey PRIMARY KEY (id));
 
+-- Length of the pipes, stored in arc_input.length so the engines don't measure the geometries on every run
+CREATE OR REPLACE FUNCTION gw_fct_refresh_arc_length()
+  RETURNS void AS
+$BODY$
+BEGIN
+
+	INSERT INTO arc_input (arc_id, length)
+	SELECT arc_id, ST_LENGTH(the_geom) FROM arc_asset
+	ON CONFLICT (arc_id) DO UPDATE SET length = excluded.length
+	WHERE arc_input.length IS DISTINCT FROM excluded.length;
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
+
+-- Once per statement, so bulk loads of arc_asset measure their pipes in a single insert
+CREATE OR REPLACE FUNCTION gw_trg_arc_asset_length()
+  RETURNS trigger AS
+$BODY$
+BEGIN
+
+	INSERT INTO arc_input (arc_id, length)
+	SELECT arc_id, ST_LENGTH(the_geom) FROM new_arcs
+	ON CONFLICT (arc_id) DO UPDATE SET length = excluded.length
+	WHERE arc_input.length IS DISTINCT FROM excluded.length;
+	RETURN NULL;
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
+
+-- Leaks per year and their first and last dates, kept by the triggers on leaks
+CREATE TABLE leaks_stats
+(year integer,
+leaks integer,
+min_date date,
+max_date date,
+ CONSTRAINT leaks_stats_pkey PRIMARY KEY (year));
+
+
+-- Recalculate the stats of @p_years (every year if NULL) from the leaks table.
+-- Upsert, so loads running at the same time don't collide on the key of a year
+CREATE OR REPLACE FUNCTION gw_fct_refresh_leaks_stats(p_years integer[] DEFAULT NULL)
+  RETURNS void AS
+$BODY$
+BEGIN
+
+	INSERT INTO leaks_stats (year, leaks, min_date, max_date)
+	SELECT date_part('year', startdate)::integer, count(*), min(startdate), max(startdate)
+	FROM leaks
+	WHERE startdate IS NOT NULL
+		AND (p_years IS NULL OR (
+			-- Range on startdate, so leaks_startdate_idx is used
+			startdate >= make_date((SELECT min(y) FROM unnest(p_years) y), 1, 1)
+			AND startdate < make_date((SELECT max(y) FROM unnest(p_years) y) + 1, 1, 1)
+			AND date_part('year', startdate)::integer = ANY(p_years)))
+	GROUP BY 1
+	ON CONFLICT (year) DO UPDATE SET leaks = excluded.leaks, min_date = excluded.min_date, max_date = excluded.max_date;
+
+	-- Years left without leaks
+	DELETE FROM leaks_stats s
+	WHERE (p_years IS NULL OR s.year = ANY(p_years))
+		AND NOT EXISTS (SELECT 1 FROM leaks l
+			WHERE l.startdate >= make_date(s.year, 1, 1) AND l.startdate < make_date(s.year + 1, 1, 1));
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
+
+-- Once per statement, only for the years of the changed leaks
+CREATE OR REPLACE FUNCTION gw_trg_leaks_stats()
+  RETURNS trigger AS
+$BODY$
+DECLARE
+	v_years integer[];
+BEGIN
+
+	IF TG_OP = 'INSERT' THEN
+		SELECT array_agg(DISTINCT date_part('year', startdate)::integer) INTO v_years
+		FROM new_leaks WHERE startdate IS NOT NULL;
+	ELSIF TG_OP = 'DELETE' THEN
+		SELECT array_agg(DISTINCT date_part('year', startdate)::integer) INTO v_years
+		FROM old_leaks WHERE startdate IS NOT NULL;
+	ELSE
+		SELECT array_agg(DISTINCT date_part('year', startdate)::integer) INTO v_years
+		FROM (SELECT startdate FROM new_leaks UNION SELECT startdate FROM old_leaks) l
+		WHERE startdate IS NOT NULL;
+	END IF;
+
+	IF v_years IS NOT NULL THEN
+		PERFORM gw_fct_refresh_leaks_stats(v_years);
+	END IF;
+	RETURN NULL;
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
 
 CREATE TABLE arc_asset
 (arc_id integer,
 code text,
 sector_id integer,
 macrosector_id integer,
-pressurezone_id character varying(30),
+presszone_id character varying(30),
 expl_id integer,
 builtdate  date,
 dnom integer,
@@ -226,6 +422,33 @@ the_geom geometry(Linestring,5367),
  CONSTRAINT arc_asset_pkey PRIMARY KEY (arc_id));
 
 
+-- Version of the pipes of the network, raised by every statement that changes arc_asset or arc_input.
+-- Engines keeping a copy of the network in memory compare it to know if the copy is still valid
+CREATE TABLE network_version
+(id boolean DEFAULT true,
+version bigint NOT NULL DEFAULT 0,
+tstamp timestamp DEFAULT now(),
+ CONSTRAINT network_version_pkey PRIMARY KEY (id),
+ CONSTRAINT network_version_id_check CHECK (id));
+
+INSERT INTO network_version (id) VALUES (true);
+
+
+-- Once per statement. The update is part of the transaction of the change, so it is seen together with it
+CREATE OR REPLACE FUNCTION gw_trg_network_version()
+  RETURNS trigger AS
+$BODY$
+BEGIN
+
+	UPDATE network_version SET version = version + 1, tstamp = now();
+	RETURN NULL;
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
+
 CREATE TABLE selector_result
 (
   result_id integer NOT NULL,
@@ -269,6 +492,37 @@ CREATE TABLE exploitation (
   CONSTRAINT exploitation_pkey PRIMARY KEY (expl_id)
 );
 
+
+-- Transition tables don't allow a column list: updates of other columns find the length unchanged and write nothing
+CREATE TRIGGER gw_trg_arc_asset_length_insert AFTER INSERT ON arc_asset
+REFERENCING NEW TABLE AS new_arcs
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_arc_asset_length();
+
+CREATE TRIGGER gw_trg_arc_asset_length_update AFTER UPDATE ON arc_asset
+REFERENCING NEW TABLE AS new_arcs
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_arc_asset_length();
+
+CREATE TRIGGER gw_trg_arc_asset_network_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON arc_asset
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_network_version();
+
+CREATE TRIGGER gw_trg_arc_input_network_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON arc_input
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_network_version();
+
+CREATE TRIGGER gw_trg_leaks_stats_insert AFTER INSERT ON leaks
+REFERENCING NEW TABLE AS new_leaks
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_leaks_stats();
+
+CREATE TRIGGER gw_trg_leaks_stats_update AFTER UPDATE ON leaks
+REFERENCING NEW TABLE AS new_leaks OLD TABLE AS old_leaks
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_leaks_stats();
+
+CREATE TRIGGER gw_trg_leaks_stats_delete AFTER DELETE ON leaks
+REFERENCING OLD TABLE AS old_leaks
+FOR EACH STATEMENT EXECUTE PROCEDURE gw_trg_leaks_stats();
+
+-- The triggers only see the leaks changed from now on: count the ones already loaded
+SELECT gw_fct_refresh_leaks_stats();
+
 CREATE OR REPLACE VIEW v_asset_arc_input
  AS
  SELECT a.arc_id,
@@ -286,54 +540,77 @@ CREATE OR REPLACE VIEW v_asset_arc_input
    FROM arc_asset a
      LEFT JOIN arc_input i USING (arc_id);
 
+-- Refresh the output of the results selected by the current user, or by every user if @p_all_users
+-- (e.g. after an assignation, since rleak is copied from arc_input)
+CREATE OR REPLACE FUNCTION gw_fct_refresh_arc_output_selected(p_all_users boolean DEFAULT false)
+  RETURNS void AS
+$BODY$
+BEGIN
+
+	DELETE FROM arc_output_selected WHERE p_all_users OR cur_user = current_user;
+
+	INSERT INTO arc_output_selected (cur_user, selector, arc_id, result_id, sector_id, macrosector_id, presszone_id,
+		expl_id, builtdate, dnom, matcat_id, pavcat_id, function_type, rleak, val, orderby, expected_year, budget,
+		total, the_geom)
+	SELECT s.cur_user, s.selector, a.arc_id, o.result_id, a.sector_id, a.macrosector_id, a.presszone_id,
+		a.expl_id, a.builtdate, a.dnom, a.matcat_id, a.pavcat_id, a.function_type, i.rleak, o.val, o.orderby,
+		o.expected_year, o.budget, o.total, a.the_geom
+	FROM (SELECT cur_user, 'main' AS selector, result_id FROM selector_result_main
+		WHERE p_all_users OR cur_user = current_user
+		UNION ALL
+		SELECT cur_user, 'compare', result_id FROM selector_result_compare
+		WHERE p_all_users OR cur_user = current_user) s
+	JOIN arc_output o ON o.result_id = s.result_id
+	JOIN arc_asset a USING (arc_id)
+	LEFT JOIN arc_input i USING (arc_id);
+
+END;
+$BODY$
+  LANGUAGE plpgsql VOLATILE
+  SET search_path FROM CURRENT;
+
 CREATE OR REPLACE VIEW v_asset_arc_output
  AS
- SELECT a.arc_id,
-    o.result_id,
-    a.sector_id,
-    a.macrosector_id,
-    a.presszone_id,
-    a.expl_id,
-    a.builtdate,
-    a.dnom,
-    a.matcat_id,
-    a.pavcat_id,
-    a.function_type,
-    i.rleak,
-    o.val,
-    o.orderby,
-    o.expected_year,
-    o.budget,
-    o.total,
-    a.the_geom
-   FROM arc_asset a
-     LEFT JOIN arc_input i USING (arc_id)
-     JOIN arc_output o USING (arc_id)
-     JOIN selector_result_main s ON s.result_id = o.result_id
-  WHERE s.cur_user = CURRENT_USER::text;
+ SELECT arc_id,
+    result_id,
+    sector_id,
+    macrosector_id,
+    presszone_id,
+    expl_id,
+    builtdate,
+    dnom,
+    matcat_id,
+    pavcat_id,
+    function_type,
+    rleak,
+    val,
+    orderby,
+    expected_year,
+    budget,
+    total,
+    the_geom
+   FROM arc_output_selected
+  WHERE cur_user = CURRENT_USER::text AND selector = 'main';
 
 CREATE OR REPLACE VIEW v_asset_arc_output_compare
  AS
- SELECT a.arc_id,
-    o.result_id,
-    a.sector_id,
-    a.macrosector_id,
-    a.presszone_id,
-    a.expl_id,
-    a.builtdate,
-    a.dnom,
-    a.matcat_id,
-    a.pavcat_id,
-    a.function_type,
-    i.rleak,
-    o.val,
-    o.orderby,
-    o.expected_year,
-    o.budget,
-    o.total,
-    a.the_geom
-   FROM arc_asset a
-     LEFT JOIN arc_input i USING (arc_id)
-     JOIN arc_output o USING (arc_id)
-     JOIN selector_result_compare s ON s.result_id = o.result_id
-  WHERE s.cur_user = CURRENT_USER::text;
+ SELECT arc_id,
+    result_id,
+    sector_id,
+    macrosector_id,
+    presszone_id,
+    expl_id,
+    builtdate,
+    dnom,
+    matcat_id,
+    pavcat_id,
+    function_type,
+    rleak,
+    val,
+    orderby,
+    expected_year,
+    budget,
+    total,
+    the_geom
+   FROM arc_output_selected
+  WHERE cur_user = CURRENT_USER::text AND selector = 'compare';
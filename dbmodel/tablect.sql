@@ -25,6 +25,41 @@ ALTER TABLE selector_result_main
       REFERENCES cat_result (result_id) MATCH SIMPLE
       ON UPDATE CASCADE ON DELETE CASCADE;
 
+ALTER TABLE arc_engine_sh
+  ADD CONSTRAINT arc_engine_sh_result_id_fkey FOREIGN KEY (result_id)
+      REFERENCES cat_result (result_id) MATCH SIMPLE
+      ON UPDATE CASCADE ON DELETE CASCADE;
+
+ALTER TABLE arc_engine_wm
+  ADD CONSTRAINT arc_engine_wm_result_id_fkey FOREIGN KEY (result_id)
+      REFERENCES cat_result (result_id) MATCH SIMPLE
+      ON UPDATE CASCADE ON DELETE CASCADE;
+
+ALTER TABLE arc_output
+  ADD CONSTRAINT arc_output_result_id_fkey FOREIGN KEY (result_id)
+      REFERENCES cat_result (result_id) MATCH SIMPLE
+      ON UPDATE CASCADE ON DELETE CASCADE;
+
+ALTER TABLE arc_output_selected
+  ADD CONSTRAINT arc_output_selected_result_id_fkey FOREIGN KEY (result_id)
+      REFERENCES cat_result (result_id) MATCH SIMPLE
+      ON UPDATE CASCADE ON DELETE CASCADE;
+
+-- Primary keys start with arc_id, so cascading deletes by result_id need their own index
+CREATE INDEX arc_engine_sh_result_id_idx ON arc_engine_sh (result_id);
+CREATE INDEX arc_engine_wm_result_id_idx ON arc_engine_wm (result_id);
+CREATE INDEX arc_output_result_id_idx ON arc_output (result_id);
+
+-- Date windows of the assignation and the refresh of leaks_stats
+CREATE INDEX leaks_startdate_idx ON leaks (startdate);
+
+-- Merge of the incremental load of leaks
+CREATE INDEX leaks_ext_code_idx ON leaks (ext_code);
+
+-- Leak-pipe search of the assignation. Also used to store both tables in spatial order (CLUSTER)
+CREATE INDEX arc_asset_the_geom_idx ON arc_asset USING gist (the_geom);
+CREATE INDEX leaks_the_geom_idx ON leaks USING gist (the_geom);
+
 
 
 ALTER TABLE leaks
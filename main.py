@@ -13,15 +13,20 @@ from pathlib import Path
 
 from qgis.PyQt.QtCore import QObject, QSettings
 from qgis.PyQt.QtWidgets import QActionGroup, QDockWidget, QToolBar
-from qgis.core import Qgis
+from qgis.core import Qgis, QgsDataSourceUri, QgsProject
 from qgis.utils import plugins
 
 from .plugin_toolbar import PluginToolbar
 from .core.toolbars import buttons
+from .core.utils import lookup_cache
+from .core.utils.config_parser import get_config
 from . import global_vars
 
 from .settings import tools_qgis, tools_os, tools_log, tools_gw, tools_db, gw_global_vars
 
+# Tables whose layers are looked up when a project is read
+PROJECT_TABLENAMES = ("v_edit_node", "v_edit_arc", "v_edit_connec", "v_asset_arc_input", "v_asset_arc_output")
+
 
 class GWAssetPlugin(QObject):
 
@@ -48,6 +53,7 @@ class GWAssetPlugin(QObject):
         self.action = None
         self.action_info = None
         self.toolButton = None
+        self.project_layers = {}
 
 
     def unload(self, remove_modules=True):
@@ -69,6 +75,11 @@ class GWAssetPlugin(QObject):
         except Exception:
             pass
 
+        # Toolbars and buttons are created again by the next project
+        self.plugin_toolbars = {}
+        self.buttons = {}
+        self.project_layers = {}
+
 
     def initGui(self):
         """ Create the menu entries and toolbar icons inside the QGIS GUI """
@@ -164,9 +175,29 @@ class GWAssetPlugin(QObject):
 
     def _project_read(self):
 
+        # Lookups and comparisons read for the previous project may come from another database
+        lookup_cache.invalidate()
+        from .core.engines import compare
+        compare.invalidate()
+
+        # Fast path: projects without any of the plugin layers skip every check and toolbar lookup
+        self.project_layers = self._get_project_layers()
+        if not self.project_layers:
+            self._set_toolbars_visible(False)
+            return
+
         if not self._check_project(True):
+            self._set_toolbars_visible(False)
             return
 
+        # Output layers read arc_output_selected: fill it for selections saved before it existed
+        tools_db.execute_sql(
+            """
+            SELECT asset.gw_fct_refresh_arc_output_selected()
+            WHERE NOT EXISTS (SELECT 1 FROM asset.arc_output_selected WHERE cur_user = current_user)
+            """
+        )
+
         # Manage section 'actions_list' of config file
         self.manage_section_actions_list()
 
@@ -178,14 +209,28 @@ class GWAssetPlugin(QObject):
 
 
 
+    def _get_project_layers(self):
+        """ Get the layers of the project the plugin cares about, indexed by table name, in a single pass.
+            Only PostgreSQL layers are inspected, so projects without them return at once """
+
+        project_layers = {}
+        for layer in QgsProject.instance().mapLayers().values():
+            if layer.providerType() != 'postgres':
+                continue
+            tablename = QgsDataSourceUri(layer.source()).table()
+            if tablename in PROJECT_TABLENAMES and tablename not in project_layers:
+                project_layers[tablename] = layer
+        return project_layers
+
+
     def _check_project(self, show_warning):
         """ Check if loaded project is valid for Giswater """
 
         # Check if table 'v_edit_node' is loaded
-        self.layer_node = tools_qgis.get_layer_by_tablename("v_edit_node")
+        self.layer_node = self.project_layers.get("v_edit_node")
         if not self.layer_node and show_warning:
-            layer_arc = tools_qgis.get_layer_by_tablename("v_edit_arc")
-            layer_connec = tools_qgis.get_layer_by_tablename("v_edit_connec")
+            layer_arc = self.project_layers.get("v_edit_arc")
+            layer_connec = self.project_layers.get("v_edit_connec")
             if layer_arc or layer_connec:
                 title = "Giswater tools plugin cannot be loaded"
                 msg = "QGIS project seems to be a Giswater project, but layer 'v_edit_node' is missing"
@@ -205,8 +250,13 @@ class GWAssetPlugin(QObject):
         # Manage action group of every toolbar
         parent = self.iface.mainWindow()
         for plugin_toolbar in list(self.plugin_toolbars.values()):
+            # Buttons already created by a previous project are reused
+            if all(index_action in self.buttons for index_action in plugin_toolbar.list_actions):
+                continue
             ag = QActionGroup(parent)
             for index_action in plugin_toolbar.list_actions:
+                if index_action in self.buttons:
+                    continue
                 button_def = self.settings.value(f"buttons_def/{index_action}")
                 button_tooltip = self.settings.value(f"buttons_tooltip/{index_action}")
                 if button_def:
@@ -215,21 +265,36 @@ class GWAssetPlugin(QObject):
                     button = getattr(buttons, button_def)(icon_path, button_def, text, plugin_toolbar.toolbar, ag)
                     self.buttons[index_action] = button
 
-        config_path = Path(global_vars.plugin_dir) / "config" / "config.config"
-        config = configparser.ConfigParser()
-        config.read(config_path)
-        hide_gw_toolbars = config.getboolean("general", "hide_gw_toolbars", fallback=False)
+        self._set_toolbars_visible(True)
 
-        input_layer = tools_qgis.get_layer_by_tablename("v_asset_arc_input")
-        output_layer = tools_qgis.get_layer_by_tablename("v_asset_arc_output")
+        hide_gw_toolbars = get_config().getboolean("general", "hide_gw_toolbars", fallback=False)
+
+        input_layer = self.project_layers.get("v_asset_arc_input")
+        output_layer = self.project_layers.get("v_asset_arc_output")
 
         if hide_gw_toolbars and input_layer and output_layer: 
             gw = plugins[Path(gw_global_vars.plugin_dir).name]
             for gwtoolbar in gw.load_project.plugin_toolbars.values():
                 gwtoolbar.toolbar.setVisible(False)
 
+    def _set_toolbars_visible(self, visible):
+        """ Show or hide the toolbars and buttons created by the plugin """
+
+        for button in self.buttons.values():
+            button.action.setVisible(visible)
+        for plugin_toolbar in self.plugin_toolbars.values():
+            # Giswater and ToC toolbars hosting the buttons are not ours to hide
+            toolbar = getattr(plugin_toolbar, 'toolbar', None)
+            if plugin_toolbar.enabled and toolbar and toolbar.objectName() == f'toolbar_{plugin_toolbar.toolbar_id}_name':
+                toolbar.setVisible(visible)
+
+
     def create_toolbar(self, toolbar_id):
 
+        # The toolbar found or created by a previous project is reused
+        if toolbar_id in self.plugin_toolbars:
+            return
+
         list_actions = self.settings.value(f"toolbars/{toolbar_id}")
         if list_actions is None:
             return
@@ -9,7 +9,7 @@ Author(s): Iván Moreno, Nestor Ibáñez
 """
 # -*- coding: utf-8 -*-
 
-import configparser, os, sys, glob, importlib
+import configparser, os, sys, importlib, json
 
 # Pointer to the module object instance itself
 this = sys.modules[__name__]
@@ -27,6 +27,10 @@ this.toolbox = None
 this.task = None
 this.gw_global_vars = None
 
+# Maximum depth searched below QGIS plugin root folder when Giswater is not a direct child plugin folder
+GISWATER_SEARCH_DEPTH = 3
+GISWATER_FOLDER_CACHE_KEY = 'gw_assetmanage_plugin/giswater_folder'
+
 
 def init_plugin():
 
@@ -55,35 +59,111 @@ def init_plugin():
 def get_giswater_folder(filename_to_find='metadata.txt', get_full_path=False):
     """ Find and return Giswater plugin folder name """
 
+    qgis_plugin_root_folder = _get_plugin_root_folder()
+
+    # Check the folder resolved in a previous session, then direct child plugin folders, then search deeper
+    folder_path = _get_cached_giswater_folder(qgis_plugin_root_folder, filename_to_find)
+    if folder_path is None:
+        folder_path = _find_giswater_folder(qgis_plugin_root_folder, filename_to_find)
+        if folder_path is not None:
+            _set_cached_giswater_folder(qgis_plugin_root_folder, folder_path, filename_to_find)
+
+    if folder_path is None:
+        return None
+    if get_full_path:
+        return folder_path
+    return os.path.basename(folder_path)
+
+
+def _get_plugin_root_folder():
+    """ Get QGIS plugin root folder """
+
     # Get QGIS plugin root folder from environment variables
-    qgis_plugin_root_folder = None
-    try:
-        if sys.platform == "win32":
-            qgis_plugin_root_folder = os.environ['QGIS_PLUGINPATH']
-        elif sys.platform == "linux":
-            qgis_plugin_root_folder = os.environ['QGIS_PLUGINPATH']
-        elif sys.platform == "darwin":
-            qgis_plugin_root_folder = os.environ['QGIS_PLUGINPATH']
-    except KeyError:
-        # Key not found
-        pass
+    qgis_plugin_root_folder = os.environ.get('QGIS_PLUGINPATH')
 
     # Get QGIS plugin root folder from qgis plugin path
     if qgis_plugin_root_folder is None:
         qgis_plugin_root_folder = os.path.dirname(os.path.dirname(__file__))
 
-    # Find @filename recursively inside this folder
-    for filename in glob.glob(f"{qgis_plugin_root_folder}/**/{filename_to_find}", recursive=True):
-        parser = configparser.ConfigParser()
+    return qgis_plugin_root_folder
+
+
+def _is_giswater_metadata(filename):
+    """ Check if @filename is the metadata file of Giswater plugin """
+
+    if not os.path.isfile(filename):
+        return False
+    parser = configparser.ConfigParser()
+    try:
         parser.read(filename)
-        if not parser.has_section('general'): continue
-        if not parser.has_option('general', 'name'): continue
-        if parser['general']['name'] == 'giswater':
-            if get_full_path:
-                return os.path.dirname(filename)
-            giswater_folder_name = os.path.basename(os.path.dirname(filename))
-            return giswater_folder_name
+    except (configparser.Error, UnicodeDecodeError):
+        return False
+    if not parser.has_section('general'): return False
+    if not parser.has_option('general', 'name'): return False
+    return parser['general']['name'] == 'giswater'
+
+
+def _find_giswater_folder(root_folder, filename_to_find):
+    """ Find Giswater folder checking direct child plugin folders first and then searching up to
+        GISWATER_SEARCH_DEPTH levels deep """
+
+    try:
+        entries = sorted(entry.path for entry in os.scandir(root_folder) if entry.is_dir())
+    except OSError:
+        return None
+
+    for folder_path in entries:
+        if _is_giswater_metadata(os.path.join(folder_path, filename_to_find)):
+            return folder_path
+
+    # Fallback: bounded-depth search (root folder itself and folders below the direct children)
+    for dirpath, dirnames, filenames in os.walk(root_folder):
+        depth = os.path.relpath(dirpath, root_folder).count(os.sep) + (dirpath != root_folder)
+        if depth >= GISWATER_SEARCH_DEPTH:
+            dirnames[:] = []
+        dirnames[:] = [x for x in dirnames if not x.startswith(('.', '__'))]
+        if depth == 1 or filename_to_find not in filenames:
+            continue
+        if _is_giswater_metadata(os.path.join(dirpath, filename_to_find)):
+            return dirpath
 
     return None
 
 
+def _get_folder_signature(root_folder, folder_path, filename_to_find):
+    """ Return modification times used to validate the cached Giswater folder """
+
+    try:
+        return [os.path.getmtime(root_folder), os.path.getmtime(os.path.join(folder_path, filename_to_find))]
+    except OSError:
+        return None
+
+
+def _get_cached_giswater_folder(root_folder, filename_to_find):
+    """ Return Giswater folder resolved in a previous session if plugin folders have not changed since then """
+
+    try:
+        from qgis.PyQt.QtCore import QSettings
+        cache = json.loads(QSettings().value(GISWATER_FOLDER_CACHE_KEY, '') or '{}')
+    except (ImportError, ValueError, TypeError):
+        return None
+
+    if cache.get('root_folder') != root_folder or not cache.get('folder_path'):
+        return None
+    signature = _get_folder_signature(root_folder, cache['folder_path'], filename_to_find)
+    if signature is None or signature != cache.get('signature'):
+        return None
+    return cache['folder_path']
+
+
+def _set_cached_giswater_folder(root_folder, folder_path, filename_to_find):
+
+    try:
+        from qgis.PyQt.QtCore import QSettings
+    except ImportError:
+        return
+
+    cache = {'root_folder': root_folder, 'folder_path': folder_path,
+             'signature': _get_folder_signature(root_folder, folder_path, filename_to_find)}
+    QSettings().setValue(GISWATER_FOLDER_CACHE_KEY, json.dumps(cache))
+